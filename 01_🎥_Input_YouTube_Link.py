@@ -1,23 +1,25 @@
-import whisper
-from pytube import YouTube
 import requests
 import time
 import streamlit as st
 from streamlit_lottie import st_lottie
-import numpy as np
-import os
-from typing import Iterator
 from io import StringIO
-from utils import write_vtt, write_srt
-import ffmpeg
+from utils import format_srt
+from model_registry import MODEL_SIZES, MODEL_PARAMETERS
+from transcription_cache import hash_audio, hash_file
+from workspace import session_workspace
+from jobs import get_queue, QUEUED, RUNNING, FAILED
+from render import burn_subtitles, mux_subtitles, ENCODER_PRESETS
 from languages import LANGUAGES
 from flores200_codes import flores_codes
+from segmentation import CAPTION_LAYOUTS
+from decoding import DECODING_PROFILES, DEFAULT_PROFILE
+from model_router import AUTO, LATENCY_BUDGET
+from pipeline import speech_segments, speech_options, make_subtitles
+from youtube import fetch, download_video, load_audio, stream_audio, media_key
+from youtube_metadata import resolve
 
 st.set_page_config(page_title="Sematube", page_icon="🎦", layout="wide")
 
-# Sema Translator
-Public_Url = 'https://lewiskimaru-helloworld.hf.space' #endpoint
-
 # Define a function that we can use to load lottie files from a link.
 @st.cache()
 def load_lottieurl(url: str):
@@ -41,77 +43,89 @@ with col2:
     ###### ➠ If you want to translate the subtitles from English to any of the 200 supported languages, select the task as "Translate with Sema" """)
     
 
-@st.cache(allow_output_mutation=True)
 def populate_metadata(link):
-    yt = YouTube(link)
-    author = yt.author
-    title = yt.title
-    description = yt.description
-    thumbnail = yt.thumbnail_url
-    length = yt.length
-    views = yt.views
-    return author, title, description, thumbnail, length, views
-
-
-@st.cache(allow_output_mutation=True)
-def download_video(link):
-    yt = YouTube(link)
-    video = yt.streams.filter(progressive=True, file_extension='mp4').order_by('resolution').desc().first().download()
-    return video
+    # Answered from the shared metadata store when any session looked this video up recently.
+    record = resolve(link)
+    return record["author"], record["title"], record["description"], record["thumbnail_url"], record["length"], record["views"]
 
 
 def convert(seconds):
     return time.strftime("%H:%M:%S", time.gmtime(seconds))
 
 
-loaded_model = whisper.load_model("base")
-current_size = "None"
+def download_audio(link):
+    audio = load_audio(link)
+    return audio, hash_audio(audio)
 
 
 @st.cache(allow_output_mutation=True)
-def change_model(current_size, size):
-    if current_size != size:
-        loaded_model = whisper.load_model(size)
-        return loaded_model
-    else:
-        raise Exception("Model size is the same as the current size.")
+def inference(link, size, task, parallel=False, layout="Whisper segments", vad=False, profile=DEFAULT_PROFILE):
+    if task not in ("Transcribe", "Translate", "Translate with Whisper"):
+        raise ValueError("Task not supported")
+    audio, media_hash = download_audio(link)
+    segments, language = speech_segments(audio, media_hash, "transcribe" if task == "Transcribe" else "translate", size,
+                                         mode="parallel" if parallel else "single", **speech_options(layout, vad, profile))
+    return make_subtitles(segments, layout), language
 
 
-@st.cache(allow_output_mutation=True)
-def inference(link, loaded_model, task):
-    yt = YouTube(link)
-    path = yt.streams.filter(only_audio=True)[0].download(filename="audio.mp3")
-    if task == "Transcribe":
-        options = dict(task="transcribe", best_of=5)
-        results = loaded_model.transcribe(path, **options)
-        vtt = getSubs(results["segments"], "vtt", 80)
-        srt = getSubs(results["segments"], "srt", 80)
-        lang = results["language"]
-        return results["text"], vtt, srt, lang
-    elif task == "Translate":
-        options = dict(task="translate", best_of=5)
-        results = loaded_model.transcribe(path, **options)
-        vtt = getSubs(results["segments"], "vtt", 80)
-        srt = getSubs(results["segments"], "srt", 80)
-        lang = results["language"]
-        return results["text"], vtt, srt, lang
-    else:
-        raise ValueError("Task not supported")
+def stream_inference(link, size, task, layout="Whisper segments", vad=False, profile=DEFAULT_PROFILE, target_code=None):
+    # Show the SRT as each window is decoded instead of after the whole video.
+    # Windows are decoded while the rest of the audio is still downloading; the
+    # language is identified on the first one and the video length comes from its metadata.
+    placeholder = st.empty()
+    srt_stream = StringIO()
 
+    def show(segment):
+        srt_stream.write(format_srt([segment], maxLineWidth=80, start_index=segment["id"] + 1))
+        with placeholder.container():
+            st.code(srt_stream.getvalue())
+            st.download_button(label="Download Partial Transcript (.srt)",
+                            data=srt_stream.getvalue(),
+                            file_name="transcript_partial.srt",
+                            key=f"partial_srt_{segment['id']}")
 
-@st.cache(allow_output_mutation=True)
-def getSubs(segments: Iterator[dict], format: str, maxLineWidth: int) -> str:
-    segmentStream = StringIO()
+    segments, language = speech_segments(stream_audio(link), media_key(link), "transcribe" if task == "Transcribe" else "translate",
+                                         size, mode="stream", duration=populate_metadata(link)[4], on_segment=show,
+                                         target_lang=target_code, **speech_options(layout, vad, profile))
+    placeholder.empty()
+    return make_subtitles(segments, layout), language
 
-    if format == 'vtt':
-        write_vtt(segments, file=segmentStream, maxLineWidth=maxLineWidth)
-    elif format == 'srt':
-        write_srt(segments, file=segmentStream, maxLineWidth=maxLineWidth)
-    else:
-        raise Exception("Unknown format " + format)
 
-    segmentStream.seek(0)
-    return segmentStream.read()
+def background_job(kind, params, key, workspace):
+    # Run on the job queue so a rerun reattaches to the job instead of restarting it.
+    queue = get_queue()
+    jobs = st.session_state.setdefault("jobs", {})
+    if key not in jobs:
+        jobs[key] = queue.submit(kind, dict(params, workspace=workspace.id))
+    bar = st.progress(0.0, text="Waiting for a worker")
+    job = queue.status(jobs[key])
+    while job["status"] in (QUEUED, RUNNING):
+        bar.progress(job["progress"], text=f"{job['status'].capitalize()} ({job['progress']:.0%})")
+        time.sleep(1)
+        job = queue.status(jobs[key])
+    bar.empty()
+    if job["status"] == FAILED:
+        del jobs[key]
+        raise RuntimeError(job["error"])
+    return job["result"]
+
+
+def background_inference(link, size, task, workspace, layout="Whisper segments", vad=False, profile=DEFAULT_PROFILE, target_code=None):
+    # The worker decodes the downloaded video and identifies its language too; this thread only waits.
+    kind = "transcribe" if task == "Transcribe" else "translate"
+    results = background_job(kind, dict(audio=download_video(link), model_size=size, target_lang=target_code,
+                                        options=speech_options(layout, vad, profile)),
+                             f"{kind}:{size}:{profile}:{layout}:{vad}:{target_code}:{link}", workspace)
+    return make_subtitles(results["segments"], layout), results["language"]
+
+
+@st.cache(allow_output_mutation=True)
+def sema_inference(link, size, target_code, parallel=False, layout="Whisper segments", vad=False, profile=DEFAULT_PROFILE):
+    # Transcribe in the original language, then translate each segment with Sema keeping its timing.
+    audio, media_hash = download_audio(link)
+    segments, language = speech_segments(audio, media_hash, "transcribe", size, mode="parallel" if parallel else "single",
+                                         target_lang=target_code, **speech_options(layout, vad, profile))
+    return make_subtitles(segments, layout), language
 
 
 def get_language_code(language):
@@ -121,54 +135,59 @@ def get_language_code(language):
     else:
         raise ValueError("Language not supported")
 
-def translate(userinput, target_lang, source_lang=None):
-    if source_lang:
-       url = f"{Public_Url}/translate_enter/"
-       data = {
-           "userinput": userinput,
-           "source_lang": source_lang,
-           "target_lang": target_lang,
-        }
-       response = requests.post(url, json=data)
-       result = response.json()
-       print(type(result))
-       source_lange = source_lang
-       translation = result['translated_text']
-       
+
+VIDEO_OUTPUTS = ["Burned-in subtitles", "Subtitle track (MP4)", "Subtitle track (MKV)"]
+
+
+def generate_subtitled_video(video, transcript, workspace, speed="Balanced", background=False):
+    if background:
+        key = f"burn:{speed}:{video}:{hash_file(transcript)}"
+        background_job("burn", dict(video=video, subtitles=transcript, speed=speed, output=workspace.file("final.mp4")), key, workspace)
     else:
-      url = f"{Public_Url}/translate_detect/"
-      data = {
-        "userinput": userinput,
-        "target_lang": target_lang,
-      }
-
-      response = requests.post(url, json=data)
-      result = response.json()
-      source_lange = result['source_language']
-      translation = result['translated_text']
-    return source_lange, translation
-
-def generate_subtitled_video(video, audio, transcript):
-    video_file = ffmpeg.input(video)
-    audio_file = ffmpeg.input(audio)
-    ffmpeg.concat(video_file.filter("subtitles", transcript), audio_file, v=1, a=1).output("final.mp4").run(quiet=True, overwrite_output=True)
-    video_with_subs = open("final.mp4", "rb")
-    return video_with_subs        
-    
+        burn_subtitles(video, transcript, workspace.file("final.mp4"), **ENCODER_PRESETS[speed])
+    video_with_subs = open(workspace.file("final.mp4"), "rb")
+    return video_with_subs
+
+
+def generate_soft_subtitled_video(video, tracks, workspace, container="mp4", background=False):
+    if background:
+        key = f"mux:{container}:{video}:" + ",".join(f"{hash_file(path)}/{language}" for path, language in tracks)
+        background_job("burn", dict(video=video, tracks=tracks, soft=True, output=workspace.file(f"final.{container}")), key, workspace)
+    else:
+        mux_subtitles(video, tracks, workspace.file(f"final.{container}"))
+    video_with_subs = open(workspace.file(f"final.{container}"), "rb")
+    return video_with_subs
 
 def main():
-    size = st.selectbox("Select Model Size (The larger the model, the more accurate the transcription will be, but it will take longer)", ["tiny", "base", "small", "medium", "large"], index=1)
-    loaded_model = change_model(current_size, size)
-    st.write(f"Model is {'multilingual' if loaded_model.is_multilingual else 'English-only'} "
-        f"and has {sum(np.prod(p.shape) for p in loaded_model.parameters()):,} parameters.")
+    workspace = session_workspace(st.session_state)
+    size = st.selectbox("Select Model Size (The larger the model, the more accurate the transcription will be, but it will take longer)", [AUTO] + MODEL_SIZES, index=0)
+    profile = st.selectbox("Decoding Profile (Fast decodes greedily, Accurate uses beam search and takes longest)", list(DECODING_PROFILES.keys()), index=list(DECODING_PROFILES.keys()).index(DEFAULT_PROFILE))
+    if size == AUTO:
+        st.write(f"The largest model expected to finish within {LATENCY_BUDGET / 60:.0f} minutes is picked for each file, "
+            "and the segments it is unsure of are decoded again with the next size up.")
+    else:
+        st.write(f"The {size} model is multilingual, has about {MODEL_PARAMETERS[size] / 1e6:,.0f} million parameters "
+            "and is used as chosen whatever the language.")
     link = st.text_input("YouTube Link (The longer the video, the longer the processing time)")
     task = st.selectbox("Select Task", ["Transcribe", "Translate with Whisper", "Translate with Sema"], index=0)
+    mode = st.selectbox("Processing Mode (Parallel splits long media at silences and uses every CPU core)", ["Live subtitles", "Single pass", "Parallel", "Background"], index=0)
+    layout = st.selectbox("Subtitle Layout (Broadcast splits cues at word timings into short, readable lines)", list(CAPTION_LAYOUTS.keys()), index=0)
+    vad = st.checkbox("Skip silence and music (only the stretches with speech are transcribed, which is faster on long recordings)", value=True)
+    speed = st.selectbox("Render Speed (Fast renders quicker at lower video quality)", list(ENCODER_PRESETS.keys()), index=1)
+    output = st.selectbox("Video Output (Subtitle tracks skip re-encoding and can be switched on and off in the player)", VIDEO_OUTPUTS, index=0)
     if task == "Transcribe":
         if st.button("Transcribe"):
             author, title, description, thumbnail, length, views = populate_metadata(link)
-            results = inference(link, loaded_model, task)
+            # One download serves both the audio being transcribed and the video rendered below.
+            fetch(link)
+            if mode == "Live subtitles":
+                results = stream_inference(link, size, task, layout, vad, profile)
+            elif mode == "Background":
+                results = background_inference(link, size, task, workspace, layout, vad, profile)
+            else:
+                results = inference(link, size, task, parallel=mode == "Parallel", layout=layout, vad=vad, profile=profile)
             video = download_video(link)
-            lang = results[3]
+            lang = results[1]
             detected_language = get_language_code(lang)
                 
             col3, col4 = st.columns(2)
@@ -177,24 +196,10 @@ def main():
             with col3:
                 st.video(video)
                 
-            # Write the results to a .txt file and download it.
-            with open("transcript.txt", "w+", encoding='utf8') as f:
-                f.writelines(results[0])
-                f.close()
-            with open(os.path.join(os.getcwd(), "transcript.txt"), "rb") as f:
-                datatxt = f.read()
-                
-            with open("transcript.vtt", "w+",encoding='utf8') as f:
-                f.writelines(results[1])
-                f.close()
-            with open(os.path.join(os.getcwd(), "transcript.vtt"), "rb") as f:
-                datavtt = f.read()
-                
-            with open("transcript.srt", "w+",encoding='utf8') as f:
-                f.writelines(results[2])
-                f.close()
-            with open(os.path.join(os.getcwd(), "transcript.srt"), "rb") as f:
-                datasrt = f.read()
+            # The downloads are served from memory; only the .srt is written, for ffmpeg.
+            datatxt, datavtt, datasrt = (results[0][format] for format in ("txt", "vtt", "srt"))
+            with open(workspace.file("transcript.srt"), "wb") as f:
+                f.write(datasrt)
 
             with col5:
                 st.download_button(label="Download Transcript (.txt)",
@@ -215,19 +220,32 @@ def main():
             
             with col4:
                 with st.spinner("Generating Subtitled Video "):
-                    video_with_subs = generate_subtitled_video(video, "audio.mp3", "transcript.srt")
-                st.video(video_with_subs)
+                    if output == "Burned-in subtitles":
+                        container = "mp4"
+                        video_with_subs = generate_subtitled_video(video, workspace.file("transcript.srt"), workspace, speed, mode == "Background")
+                    else:
+                        container = "mkv" if output.endswith("(MKV)") else "mp4"
+                        video_with_subs = generate_soft_subtitled_video(video, [(workspace.file("transcript.srt"), detected_language)], workspace, container, mode == "Background")
+                if container == "mp4":
+                    st.video(video_with_subs)
                 st.balloons()
             with col8:
                 st.download_button(label="Download Subtitled Video",
                                     data=video_with_subs,
-                                    file_name=f"{title} with subtitles.mp4")
+                                    file_name=f"{title} with subtitles.{container}")
     elif task == "Translate with Whisper":
         if st.button("Translate to English"):
             author, title, description, thumbnail, length, views = populate_metadata(link)
-            results = inference(link, loaded_model, task)
+            # One download serves both the audio being transcribed and the video rendered below.
+            fetch(link)
+            if mode == "Live subtitles":
+                results = stream_inference(link, size, task, layout, vad, profile)
+            elif mode == "Background":
+                results = background_inference(link, size, task, workspace, layout, vad, profile)
+            else:
+                results = inference(link, size, task, parallel=mode == "Parallel", layout=layout, vad=vad, profile=profile)
             video = download_video(link)
-            lang = results[3]
+            lang = results[1]
             detected_language = get_language_code(lang)
                 
             col3, col4 = st.columns(2)
@@ -236,24 +254,10 @@ def main():
             with col3:
                 st.video(video)
                 
-            # Write the results to a .txt file and download it.
-            with open("transcript.txt", "w+", encoding='utf8') as f:
-                f.writelines(results[0])
-                f.close()
-            with open(os.path.join(os.getcwd(), "transcript.txt"), "rb") as f:
-                datatxt = f.read()
-                
-            with open("transcript.vtt", "w+",encoding='utf8') as f:
-                f.writelines(results[1])
-                f.close()
-            with open(os.path.join(os.getcwd(), "transcript.vtt"), "rb") as f:
-                datavtt = f.read()
-                
-            with open("transcript.srt", "w+",encoding='utf8') as f:
-                f.writelines(results[2])
-                f.close()
-            with open(os.path.join(os.getcwd(), "transcript.srt"), "rb") as f:
-                datasrt = f.read()
+            # The downloads are served from memory; only the .srt is written, for ffmpeg.
+            datatxt, datavtt, datasrt = (results[0][format] for format in ("txt", "vtt", "srt"))
+            with open(workspace.file("transcript.srt"), "wb") as f:
+                f.write(datasrt)
             with col5:
                 st.download_button(label="Download Transcript (.txt)",
                                 data=datatxt,
@@ -273,18 +277,81 @@ def main():
             
             with col4:
                 with st.spinner("Generating Subtitled Video "):
-                    video_with_subs = generate_subtitled_video(video, "audio.mp3", "transcript.srt")
-                st.video(video_with_subs)
+                    if output == "Burned-in subtitles":
+                        container = "mp4"
+                        video_with_subs = generate_subtitled_video(video, workspace.file("transcript.srt"), workspace, speed, mode == "Background")
+                    else:
+                        container = "mkv" if output.endswith("(MKV)") else "mp4"
+                        video_with_subs = generate_soft_subtitled_video(video, [(workspace.file("transcript.srt"), "eng")], workspace, container, mode == "Background")
+                if container == "mp4":
+                    st.video(video_with_subs)
                 st.balloons()
             with col8:
                 st.download_button(label="Download Subtitled Video ",
                                     data=video_with_subs,
-                                    file_name=f"{title} with subtitles.mp4")
+                                    file_name=f"{title} with subtitles.{container}")
     elif task == "Translate with Sema":
         default_language = "French"
         target = st.selectbox("Select Language", list(flores_codes.keys()), index=list(flores_codes.keys()).index(default_language))
         target_code = flores_codes[target]
-        
+        if st.button("Translate with Sema"):
+            author, title, description, thumbnail, length, views = populate_metadata(link)
+            # One download serves both the audio being transcribed and the video rendered below.
+            fetch(link)
+            # Every mode transcribes in the original language; Sema translates the finished segments.
+            if mode == "Live subtitles":
+                results = stream_inference(link, size, "Transcribe", layout, vad, profile, target_code)
+            elif mode == "Background":
+                results = background_inference(link, size, "Transcribe", workspace, layout, vad, profile, target_code)
+            else:
+                results = sema_inference(link, size, target_code, parallel=mode == "Parallel", layout=layout, vad=vad, profile=profile)
+            video = download_video(link)
+            lang = results[1]
+            detected_language = get_language_code(lang)
+                
+            col3, col4 = st.columns(2)
+            col5, col6, col7, col8 = st.columns(4)
+            col9, col10 = st.columns(2)
+            with col3:
+                st.video(video)
+                
+            # The downloads are served from memory; only the .srt is written, for ffmpeg.
+            datatxt, datavtt, datasrt = (results[0][format] for format in ("txt", "vtt", "srt"))
+            with open(workspace.file("transcript.srt"), "wb") as f:
+                f.write(datasrt)
+
+            with col5:
+                st.download_button(label="Download Transcript (.txt)",
+                                data=datatxt,
+                                file_name="transcript.txt")
+            with col6:   
+                st.download_button(label="Download Transcript (.vtt)",
+                                    data=datavtt,
+                                    file_name="transcript.vtt")
+            with col7:
+                st.download_button(label="Download Transcript (.srt)",
+                                    data=datasrt,
+                                    file_name="transcript.srt")
+            with col9:
+                st.success("You can download the transcript in .srt format, edit it (if you need to) and upload it to YouTube to create subtitles for your video.")
+            with col10:
+                st.info("Streamlit refreshes after the download button is clicked. The data is cached so you can download the transcript again without having to transcribe the video again.")
+            
+            with col4:
+                with st.spinner("Generating Subtitled Video "):
+                    if output == "Burned-in subtitles":
+                        container = "mp4"
+                        video_with_subs = generate_subtitled_video(video, workspace.file("transcript.srt"), workspace, speed, mode == "Background")
+                    else:
+                        container = "mkv" if output.endswith("(MKV)") else "mp4"
+                        video_with_subs = generate_soft_subtitled_video(video, [(workspace.file("transcript.srt"), target_code.split("_")[0])], workspace, container, mode == "Background")
+                if container == "mp4":
+                    st.video(video_with_subs)
+                st.balloons()
+            with col8:
+                st.download_button(label="Download Subtitled Video",
+                                    data=video_with_subs,
+                                    file_name=f"{title} with subtitles.{container}")
     else:
         st.error("Please select a task.")
 
@@ -0,0 +1,137 @@
+"""
+HTTP interface to the job queue, for services that want subtitles without
+the Streamlit pages.
+
+    uvicorn api:app --host 0.0.0.0 --port 8000
+
+    curl -F file=@talk.mp4 localhost:8000/jobs/transcribe        -> {"id": ..., "status": "queued"}
+    curl localhost:8000/jobs/<id>                                 -> status and progress
+    curl -o talk.srt localhost:8000/jobs/<id>/result?format=srt
+
+Jobs go to the same SQLite queue and worker processes as the pages'
+background mode, so models are loaded once per worker whichever interface
+submitted the job.
+"""
+import pathlib
+import shutil
+
+from fastapi import FastAPI, File, Form, HTTPException, UploadFile
+from fastapi.responses import FileResponse
+
+from decoding import DECODING_PROFILES, DEFAULT_PROFILE
+from jobs import DONE, FAILED, get_queue
+from model_registry import MODEL_SIZES
+from model_router import AUTO
+from pipeline import DEFAULT_LAYOUT, make_subtitles, speech_options
+from render import ENCODER_PRESETS
+from segmentation import CAPTION_LAYOUTS
+from utils import SUBTITLE_FORMATS
+from workspace import WORKSPACE_ROOT, Workspace, touch_workspace
+
+# Bytes copied at a time from an upload into its workspace.
+UPLOAD_CHUNK = 1 << 20
+
+app = FastAPI(title="subtitles")
+
+
+@app.on_event("startup")
+def start_workers():
+    get_queue()
+
+
+def _save(upload: UploadFile, workspace: Workspace, name: str) -> str:
+    # Copied in chunks so a large video is never held in memory.
+    path = workspace.file(name + pathlib.Path(upload.filename or "").suffix.lower())
+    with open(path, "wb") as f:
+        shutil.copyfileobj(upload.file, f, UPLOAD_CHUNK)
+    return path
+
+
+def _check(value, choices, name: str):
+    if value not in choices:
+        raise HTTPException(422, f"Unknown {name} {value!r}, expected one of {', '.join(choices)}")
+
+
+def _submit(kind: str, params: dict, workspace: Workspace) -> dict:
+    job_id = get_queue().submit(kind, dict(params, workspace=workspace.id))
+    return {"id": job_id, "status": get_queue().status(job_id)["status"]}
+
+
+def _job(job_id: str) -> dict:
+    job = get_queue().status(job_id)
+    if job is None:
+        raise HTTPException(404, f"No job {job_id}")
+    return job
+
+
+def _speech_job(kind: str, file: UploadFile, model: str, profile: str, layout: str, vad: bool) -> dict:
+    _check(model, [AUTO] + MODEL_SIZES, "model")
+    _check(profile, list(DECODING_PROFILES), "profile")
+    _check(layout, list(CAPTION_LAYOUTS), "layout")
+    workspace = Workspace()
+    return _submit(kind, dict(audio=_save(file, workspace, "input"), model_size=model, layout=layout,
+                              options=speech_options(layout, vad, profile)), workspace)
+
+
+@app.post("/jobs/transcribe", status_code=202)
+def submit_transcription(file: UploadFile = File(...), model: str = Form(AUTO), profile: str = Form(DEFAULT_PROFILE),
+                         layout: str = Form(DEFAULT_LAYOUT), vad: bool = Form(True)):
+    """Queue a transcription of an uploaded audio or video file."""
+    return _speech_job("transcribe", file, model, profile, layout, vad)
+
+
+@app.post("/jobs/translate", status_code=202)
+def submit_translation(file: UploadFile = File(...), model: str = Form(AUTO), profile: str = Form(DEFAULT_PROFILE),
+                       layout: str = Form(DEFAULT_LAYOUT), vad: bool = Form(True)):
+    """Queue a translation to English of an uploaded audio or video file."""
+    return _speech_job("translate", file, model, profile, layout, vad)
+
+
+@app.post("/jobs/burn", status_code=202)
+def submit_burn(video: UploadFile = File(...), subtitles: UploadFile = File(...), soft: bool = Form(False),
+                speed: str = Form("Balanced"), language: str = Form("und")):
+    """
+    Queue adding `subtitles` (SRT or VTT) to `video`: hard-burnt and re-encoded
+    at `speed`, or with `soft` as a selectable track tagged with the ISO 639-2
+    `language`, without re-encoding.
+    """
+    _check(speed, list(ENCODER_PRESETS), "speed")
+    workspace = Workspace()
+    video_path = _save(video, workspace, "input")
+    subtitles_path = _save(subtitles, workspace, "subtitles")
+    container = "mkv" if video_path.endswith(".mkv") else "mp4"
+    return _submit("burn", dict(video=video_path, subtitles=subtitles_path, tracks=[(subtitles_path, language)],
+                                soft=soft, speed=speed, output=workspace.file(f"final.{container}")), workspace)
+
+
+@app.get("/jobs/{job_id}")
+def job_status(job_id: str):
+    job = _job(job_id)
+    return {key: job[key] for key in ("id", "kind", "status", "progress", "error", "created", "updated")}
+
+
+@app.get("/jobs/{job_id}/result")
+def job_result(job_id: str, format: str = "srt"):
+    """
+    Download the result of a finished job: the subtitles in `format` for a
+    transcription or translation, the video for a burn. Files are streamed
+    from the job's workspace in chunks.
+    """
+    job = _job(job_id)
+    if job["status"] == FAILED:
+        raise HTTPException(409, job["error"])
+    if job["status"] != DONE:
+        raise HTTPException(409, f"Job {job_id} is {job['status']}")
+    if not touch_workspace(job["params"]["workspace"]):
+        raise HTTPException(410, f"The files of job {job_id} have been cleaned up")
+
+    if job["kind"] == "burn":
+        path = pathlib.Path(job["result"]["output"])
+        return FileResponse(path, filename=path.name)
+
+    _check(format, SUBTITLE_FORMATS, "format")
+    path = WORKSPACE_ROOT / job["params"]["workspace"] / f"transcript.{format}"
+    if not path.exists():
+        path.write_bytes(make_subtitles(job["result"]["segments"], job["params"]["layout"], (format,))[format])
+    language = "en" if job["kind"] == "translate" else job["result"]["language"]
+    return FileResponse(path, filename=f"transcript.{language}.{format}")
@@ -0,0 +1,250 @@
+import os
+import shutil
+import tempfile
+import threading
+
+import ffmpeg
+import numpy as np
+from whisper.audio import SAMPLE_RATE
+
+
+def _decode(stream, source=None, sr: int = SAMPLE_RATE) -> bytes:
+    process = (
+        stream.output("pipe:1", format="s16le", acodec="pcm_s16le", ac=1, ar=sr)
+        .run_async(pipe_stdin=source is not None, pipe_stdout=True, pipe_stderr=True)
+    )
+    stderr = []
+
+    def feed():
+        try:
+            for chunk in iter(lambda: source.read(1 << 20), b""):
+                process.stdin.write(chunk)
+        except BrokenPipeError:
+            pass
+        finally:
+            process.stdin.close()
+
+    threads = [threading.Thread(target=lambda: stderr.append(process.stderr.read()), daemon=True)]
+    if source is not None:
+        threads.append(threading.Thread(target=feed, daemon=True))
+    for thread in threads:
+        thread.start()
+    out = process.stdout.read()
+    process.wait()
+    for thread in threads:
+        thread.join()
+    if process.returncode != 0:
+        raise ffmpeg.Error("ffmpeg", out, b"".join(stderr))
+    return out
+
+
+def decode_audio(source, sr: int = SAMPLE_RATE) -> np.ndarray:
+    """
+    Decode `source` (a path or a binary file-like object such as a Streamlit
+    upload) to a mono float32 array at `sr` Hz, the format Whisper's
+    transcribe() accepts directly.
+
+    File-like sources are streamed to ffmpeg's stdin and the PCM is read back
+    from its stdout, so nothing touches the disk. MP4/MOV files whose index
+    sits at the end of the file cannot be demuxed from a pipe; those are
+    spooled to a temporary file and decoded from there.
+    """
+    if isinstance(source, (str, os.PathLike)):
+        pcm = _decode(ffmpeg.input(str(source), threads=0), sr=sr)
+    else:
+        source.seek(0)
+        try:
+            pcm = _decode(ffmpeg.input("pipe:0", threads=0), source, sr=sr)
+        except ffmpeg.Error:
+            source.seek(0)
+            with tempfile.NamedTemporaryFile() as spool:
+                shutil.copyfileobj(source, spool)
+                spool.flush()
+                pcm = _decode(ffmpeg.input(spool.name, threads=0), sr=sr)
+    return np.frombuffer(pcm, np.int16).flatten().astype(np.float32) / 32768.0
+
+
+def stream_decode(chunks, sr: int = SAMPLE_RATE, block_seconds: float = 30):
+    """
+    Decode media that arrives as an iterable of byte `chunks`, such as a
+    download in progress, yielding float32 blocks of `block_seconds` at `sr` Hz
+    as soon as ffmpeg has produced each one. The last block may be shorter.
+
+    Only formats that can be demuxed from a pipe work (WebM, MP3, fragmented
+    MP4); ffmpeg.Error is raised for the rest.
+    """
+    process = (
+        ffmpeg.input("pipe:0", threads=0)
+        .output("pipe:1", format="s16le", acodec="pcm_s16le", ac=1, ar=sr)
+        .run_async(pipe_stdin=True, pipe_stdout=True, pipe_stderr=True)
+    )
+    stderr = []
+
+    def feed():
+        try:
+            for chunk in chunks:
+                process.stdin.write(chunk)
+        except BrokenPipeError:
+            pass
+        finally:
+            process.stdin.close()
+
+    threads = [threading.Thread(target=lambda: stderr.append(process.stderr.read()), daemon=True),
+               threading.Thread(target=feed, daemon=True)]
+    for thread in threads:
+        thread.start()
+
+    finished = False
+    try:
+        for pcm in iter(lambda: process.stdout.read(int(block_seconds * sr) * 2), b""):
+            yield np.frombuffer(pcm, np.int16).astype(np.float32) / 32768.0
+        finished = True
+    finally:
+        if not finished:
+            # The consumer stopped early; don't wait for the rest of the download.
+            process.kill()
+        process.wait()
+    for thread in threads:
+        thread.join()
+    if process.returncode != 0:
+        raise ffmpeg.Error("ffmpeg", b"", b"".join(stderr))
+
+
+def frame_energy(audio: np.ndarray, frame_seconds: float = 0.02) -> np.ndarray:
+    """Return the RMS level of each non-overlapping frame of `audio`, in dBFS."""
+    frame = int(frame_seconds * SAMPLE_RATE)
+    count = len(audio) // frame
+    if count == 0:
+        return np.zeros(0, dtype=np.float32)
+    frames = audio[:count * frame].reshape(count, frame)
+    rms = np.sqrt(np.mean(np.square(frames, dtype=np.float32), axis=1))
+    return 20 * np.log10(np.maximum(rms, 1e-10))
+
+
+def find_silences(audio: np.ndarray, threshold_db: float = -40.0, min_silence: float = 0.5,
+                  frame_seconds: float = 0.02) -> np.ndarray:
+    """
+    Return an (N, 2) array of [start, end) sample offsets of the stretches of
+    `audio` quieter than `threshold_db` for at least `min_silence` seconds.
+    """
+    frame = int(frame_seconds * SAMPLE_RATE)
+    quiet = np.concatenate(([False], frame_energy(audio, frame_seconds) < threshold_db, [False]))
+    edges = np.flatnonzero(np.diff(quiet.astype(np.int8)))
+    runs = edges.reshape(-1, 2)
+    runs = runs[(runs[:, 1] - runs[:, 0]) * frame_seconds >= min_silence]
+    return runs * frame
+
+
+def split_on_silence(audio: np.ndarray, chunk_seconds: float = 300, max_seconds: float = 360,
+                     **silence_options) -> list:
+    """
+    Split `audio` into consecutive (start, end) sample ranges of roughly
+    `chunk_seconds`, cutting in the middle of the silence closest to each
+    target boundary. A chunk is cut hard at `max_seconds` when no silence is
+    found in between.
+    """
+    silences = find_silences(audio, **silence_options)
+    cuts = (silences[:, 0] + silences[:, 1]) // 2
+    target = int(chunk_seconds * SAMPLE_RATE)
+    limit = int(max_seconds * SAMPLE_RATE)
+
+    bounds = []
+    start = 0
+    while len(audio) - start > limit:
+        candidates = cuts[(cuts > start + target // 2) & (cuts <= start + limit)]
+        if len(candidates):
+            end = int(candidates[np.argmin(np.abs(candidates - (start + target)))])
+        else:
+            end = start + limit
+        bounds.append((start, end))
+        start = end
+    bounds.append((start, len(audio)))
+    return bounds
+
+
+def _merge_runs(starts: np.ndarray, ends: np.ndarray, min_gap: int):
+    # Join runs separated by fewer than `min_gap` frames.
+    if len(starts) == 0:
+        return starts, ends
+    split = starts[1:] - ends[:-1] >= min_gap
+    return starts[np.concatenate(([True], split))], ends[np.concatenate((split, [True]))]
+
+
+def find_speech(audio: np.ndarray, threshold_db: float = None, min_speech: float = 0.3, min_silence: float = 0.8,
+                padding: float = 0.25, min_modulation_db: float = 3.0, frame_seconds: float = 0.02) -> np.ndarray:
+    """
+    Return an (N, 2) array of [start, end) sample offsets of the stretches of
+    `audio` that are likely to hold speech.
+
+    A frame counts as speech when it is louder than `threshold_db` (by default
+    15 dB above the noise floor, taken as the 10th percentile of frame levels)
+    and the level over the surrounding second swings by at least
+    `min_modulation_db`, as it does between syllables but not in steady music
+    or hum. Gaps shorter than `min_silence` are bridged, regions shorter than
+    `min_speech` dropped and the rest widened by `padding` on each side.
+    """
+    frame = int(frame_seconds * SAMPLE_RATE)
+    energy = frame_energy(audio, frame_seconds)
+    if len(energy) == 0:
+        return np.zeros((0, 2), dtype=np.int64)
+
+    floor = np.percentile(energy, 10)
+    if threshold_db is None:
+        threshold_db = max(floor + 15, -50.0)
+    level = np.maximum(energy, floor)
+    window = max(1, int(round(1 / frame_seconds)))
+    kernel = np.ones(window) / window
+    mean = np.convolve(level, kernel, mode="same")
+    spread = np.sqrt(np.maximum(np.convolve(level ** 2, kernel, mode="same") - mean ** 2, 0))
+    speech = (energy > threshold_db) & (spread >= min_modulation_db)
+
+    runs = np.flatnonzero(np.diff(np.concatenate(([False], speech, [False])).astype(np.int8))).reshape(-1, 2)
+    if len(runs) == 0:
+        return np.zeros((0, 2), dtype=np.int64)
+    starts, ends = _merge_runs(runs[:, 0], runs[:, 1], int(min_silence / frame_seconds))
+    keep = (ends - starts) * frame_seconds >= min_speech
+    if not keep.any():
+        return np.zeros((0, 2), dtype=np.int64)
+    pad = int(padding / frame_seconds)
+    starts, ends = _merge_runs(np.maximum(starts[keep] - pad, 0), ends[keep] + pad, 0)
+    return np.minimum(np.stack([starts, ends], axis=1).astype(np.int64) * frame, len(audio))
+
+
+def compact_speech(audio: np.ndarray, regions: np.ndarray):
+    """
+    Concatenate the `regions` of `audio` found by find_speech(). Returns the
+    shortened audio and an (N, 2) timeline of [offset in it, offset in
+    `audio`] sample pairs, one per region, for to_original().
+    """
+    lengths = regions[:, 1] - regions[:, 0]
+    timeline = np.stack([np.concatenate(([0], np.cumsum(lengths)[:-1])), regions[:, 0]], axis=1)
+    return np.concatenate([audio[start:end] for start, end in regions]), timeline
+
+
+def speech_span(audio: np.ndarray, regions: np.ndarray, start: int, length: int) -> np.ndarray:
+    """
+    Samples [start, start + length) of what compact_speech() would return for
+    `regions`, copying only the regions that overlap them.
+    """
+    lengths = regions[:, 1] - regions[:, 0]
+    offsets = np.concatenate(([0], np.cumsum(lengths)))
+    end = start + length
+    pieces = []
+    for i in range(max(int(np.searchsorted(offsets, start, side="right")) - 1, 0), len(regions)):
+        if offsets[i] >= end:
+            break
+        low = regions[i, 0] + max(start - offsets[i], 0)
+        high = regions[i, 0] + min(end - offsets[i], lengths[i])
+        pieces.append(audio[low:high])
+    return np.concatenate(pieces) if pieces else audio[:0]
+
+
+def to_original(seconds: float, timeline: np.ndarray, end: bool = False) -> float:
+    """
+    Map a time in compacted audio back to the original. A time on the seam
+    between two regions belongs to the later one, or to the earlier one when
+    it is the `end` of something.
+    """
+    sample = seconds * SAMPLE_RATE
+    i = max(int(np.searchsorted(timeline[:, 0], sample, side="left" if end else "right")) - 1, 0)
+    return float(seconds + (timeline[i, 1] - timeline[i, 0]) / SAMPLE_RATE)
@@ -0,0 +1,53 @@
+"""
+Real-time factor of each decoding profile in decoding.py on one clip.
+
+    python benchmarks/decoding_profiles.py clip.wav --model base --repeat 3
+
+RTF is decode time divided by clip duration (below 1 is faster than real
+time). The transcription cache is bypassed and the model is loaded before
+timing starts. Keep the clip fixed between runs so the numbers compare.
+"""
+import argparse
+import pathlib
+import sys
+import time
+
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parent.parent))
+
+from whisper.audio import SAMPLE_RATE  # noqa: E402
+
+from audio import decode_audio  # noqa: E402
+from decoding import DECODING_PROFILES, decode_options  # noqa: E402
+from model_registry import MODEL_SIZES, get_model  # noqa: E402
+from transcriber import _threads  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("clip", help="audio or video file to decode")
+    parser.add_argument("--model", default="base", choices=MODEL_SIZES)
+    parser.add_argument("--profile", action="append", choices=list(DECODING_PROFILES), help="default: all of them")
+    parser.add_argument("--threads", type=int, default=0, help="torch threads; 0 keeps the default")
+    parser.add_argument("--repeat", type=int, default=1)
+    args = parser.parse_args()
+
+    audio = decode_audio(args.clip)
+    duration = len(audio) / SAMPLE_RATE
+    model = get_model(args.model)
+    print(f"{args.clip}: {duration:.1f} s, model {args.model}")
+
+    for profile in args.profile or DECODING_PROFILES:
+        options = decode_options(profile, threads=args.threads)
+        threads = options.pop("threads", None)
+        timings = []
+        for _ in range(args.repeat):
+            started = time.perf_counter()
+            with _threads(threads):
+                results = model.transcribe(audio, **options)
+            timings.append(time.perf_counter() - started)
+        elapsed = min(timings)
+        print(f"  {profile:<24} {elapsed:7.1f} s  RTF {elapsed / duration:.3f}  {len(results['segments'])} segments")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,40 @@
+"""
+Latency of the language identification fast path in language_id.py.
+
+    python benchmarks/language_id.py clip1.mp4 clip2.wav --model tiny
+
+The model is loaded and the audio decoded before timing starts, and the
+cache is bypassed, so the figure is what detect_language() adds ahead of a
+transcription.
+"""
+import argparse
+import pathlib
+import sys
+import time
+
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parent.parent))
+
+from audio import decode_audio  # noqa: E402
+from language_id import LANGUAGE_ID_MODEL, detect_language  # noqa: E402
+from model_registry import get_model  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("media", nargs="+", help="audio or video files")
+    parser.add_argument("--model", default=LANGUAGE_ID_MODEL)
+    parser.add_argument("--windows", type=int, default=3)
+    args = parser.parse_args()
+
+    get_model(args.model)
+    for path in args.media:
+        audio = decode_audio(path)
+        started = time.perf_counter()
+        result = detect_language(audio, model_size=args.model, windows=args.windows)
+        elapsed = time.perf_counter() - started
+        print(f"{path}: {result['language']} (p={result['probability']:.2f}, {result['windows']} window(s)) "
+              f"in {elapsed * 1000:.0f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+"""
+Round-trip benchmark for the subtitle writers and parser in utils.py.
+
+    python benchmarks/subtitle_roundtrip.py --segments 50000
+
+Writes a synthetic transcript as SRT and VTT, parses it back, checks that
+timings and text survive, and reports the time spent in each step.
+"""
+import argparse
+import pathlib
+import random
+import sys
+import time
+from io import StringIO
+
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parent.parent))
+
+from utils import parse_subtitles, write_srt, write_vtt  # noqa: E402
+
+WORDS = "the a lecture today we will look at how subtitles are timed and written to disk".split()
+
+
+def synthetic_segments(count: int, seed: int = 0) -> list:
+    rng = random.Random(seed)
+    segments, start = [], 0.0
+    for i in range(count):
+        duration = rng.uniform(0.8, 6.0)
+        text = " ".join(rng.choice(WORDS) for _ in range(rng.randint(3, 18)))
+        segments.append({"id": i, "start": round(start, 3), "end": round(start + duration, 3), "text": text})
+        start += duration + rng.uniform(0.0, 1.0)
+    return segments
+
+
+def timed(fn):
+    started = time.perf_counter()
+    result = fn()
+    return result, time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--segments", type=int, default=20000)
+    args = parser.parse_args()
+
+    segments = synthetic_segments(args.segments)
+    for format, writer in (("srt", write_srt), ("vtt", write_vtt)):
+        def write():
+            stream = StringIO()
+            writer(segments, file=stream)
+            return stream.getvalue()
+
+        document, write_seconds = timed(write)
+        parsed, parse_seconds = timed(lambda: list(parse_subtitles(StringIO(document))))
+
+        assert len(parsed) == len(segments), f"{format}: parsed {len(parsed)} of {len(segments)} cues"
+        for original, cue in zip(segments, parsed):
+            assert abs(original["start"] - cue["start"]) < 1e-3 and abs(original["end"] - cue["end"]) < 1e-3
+            assert original["text"] == cue["text"]
+
+        print(f"{format}: {len(segments)} cues, {len(document) / 1e6:.1f} MB, "
+              f"write {write_seconds * 1000:.0f} ms, parse {parse_seconds * 1000:.0f} ms "
+              f"({len(segments) / parse_seconds:,.0f} cues/s)")
+
+
+if __name__ == "__main__":
+    main()
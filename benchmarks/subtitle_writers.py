@@ -0,0 +1,87 @@
+"""
+Microbenchmark of the batch subtitle writers in utils.py against the previous
+per-cue print(..., flush=True) writers, and of export_subtitles() against
+building each download format separately.
+
+    python benchmarks/subtitle_writers.py --segments 50000 --repeat 5
+"""
+import argparse
+import pathlib
+import sys
+import tempfile
+import time
+from io import BytesIO, StringIO
+
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parent.parent))
+
+from subtitle_roundtrip import synthetic_segments  # noqa: E402
+from utils import export_subtitles, format_timestamp, processText, write_srt, write_vtt  # noqa: E402
+
+
+def legacy_write_vtt(transcript, file, maxLineWidth=None):
+    print("WEBVTT\n", file=file)
+    for segment in transcript:
+        text = processText(segment['text'], maxLineWidth).replace('-->', '->')
+        print(f"{format_timestamp(segment['start'])} --> {format_timestamp(segment['end'])}\n{text}\n", file=file, flush=True)
+
+
+def legacy_write_srt(transcript, file, maxLineWidth=None):
+    for i, segment in enumerate(transcript, start=1):
+        text = processText(segment['text'].strip(), maxLineWidth).replace('-->', '->')
+        print(
+            f"{i}\n"
+            f"{format_timestamp(segment['start'], always_include_hours=True, fractionalSeperator=',')} --> "
+            f"{format_timestamp(segment['end'], always_include_hours=True, fractionalSeperator=',')}\n"
+            f"{text}\n",
+            file=file,
+            flush=True,
+        )
+
+
+def best_of(repeat: int, fn) -> float:
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - started)
+    return min(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--segments", type=int, default=20000)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--width", type=int, default=None, help="maxLineWidth passed to the writers")
+    args = parser.parse_args()
+
+    segments = synthetic_segments(args.segments)
+    for name, legacy, writer in (("srt", legacy_write_srt, write_srt), ("vtt", legacy_write_vtt, write_vtt)):
+        old = best_of(args.repeat, lambda: legacy(segments, StringIO(), args.width))
+        new = best_of(args.repeat, lambda: writer(segments, StringIO(), args.width))
+        new_bytes = best_of(args.repeat, lambda: writer(segments, BytesIO(), args.width))
+        with tempfile.TemporaryFile("w+", encoding="utf8") as f:
+            old_file = best_of(args.repeat, lambda: legacy(segments, f, args.width))
+            new_file = best_of(args.repeat, lambda: writer(segments, f, args.width))
+        print(f"{name}: {len(segments)} cues\n"
+              f"  StringIO  legacy {old * 1000:6.0f} ms  batch {new * 1000:6.0f} ms ({old / new:.1f}x)\n"
+              f"  BytesIO                    batch {new_bytes * 1000:6.0f} ms\n"
+              f"  file      legacy {old_file * 1000:6.0f} ms  batch {new_file * 1000:6.0f} ms ({old_file / new_file:.1f}x)")
+
+    # What a page used to do for its downloads (getSubs per format, write then reread)
+    # against a single export_subtitles() pass.
+    def separate():
+        for name, writer in (("vtt", write_vtt), ("srt", write_srt)):
+            stream = StringIO()
+            writer(segments, stream, args.width)
+            with tempfile.TemporaryFile("w+", encoding="utf8") as f:
+                f.write(stream.getvalue())
+                f.seek(0)
+                f.read().encode("utf-8")
+
+    old = best_of(args.repeat, separate)
+    new = best_of(args.repeat, lambda: export_subtitles(segments, ("txt", "vtt", "srt"), args.width))
+    print(f"downloads: per-format writers {old * 1000:.0f} ms, export_subtitles (txt+vtt+srt) {new * 1000:.0f} ms ({old / new:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
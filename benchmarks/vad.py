@@ -0,0 +1,58 @@
+"""
+How much audio the speech pre-pass in audio.py leaves for Whisper to decode.
+
+    python benchmarks/vad.py lecture.mp4 stream.m4a
+    python benchmarks/vad.py            # synthetic speech, music and silence
+
+Prints the speech regions found, the share of the audio they cover and the
+time the pre-pass itself takes.
+"""
+import argparse
+import pathlib
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parent.parent))
+
+from audio import decode_audio, find_speech  # noqa: E402
+from whisper.audio import SAMPLE_RATE  # noqa: E402
+
+
+def synthetic_audio(seed: int = 0) -> np.ndarray:
+    """Ten minutes alternating syllable-modulated noise, steady tones and near silence."""
+    rng = np.random.default_rng(seed)
+    parts = []
+    for _ in range(10):
+        t = np.arange(30 * SAMPLE_RATE) / SAMPLE_RATE
+        parts.append(rng.standard_normal(len(t)) * 0.2 * (np.sin(2 * np.pi * 4 * t) > 0))
+        t = np.arange(20 * SAMPLE_RATE) / SAMPLE_RATE
+        parts.append(0.3 * np.sin(2 * np.pi * 440 * t) + 0.2 * np.sin(2 * np.pi * 660 * t))
+        parts.append(rng.standard_normal(10 * SAMPLE_RATE) * 0.001)
+    return np.concatenate(parts).astype(np.float32)
+
+
+def report(name: str, audio: np.ndarray):
+    started = time.perf_counter()
+    regions = find_speech(audio)
+    elapsed = time.perf_counter() - started
+    speech = int((regions[:, 1] - regions[:, 0]).sum())
+    print(f"{name}: {len(audio) / SAMPLE_RATE:.0f} s, {len(regions)} speech regions, "
+          f"{speech / max(len(audio), 1):.0%} kept ({1 - speech / max(len(audio), 1):.0%} skipped), "
+          f"pre-pass {elapsed * 1000:.0f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("media", nargs="*", help="audio or video files to analyse")
+    args = parser.parse_args()
+
+    if not args.media:
+        report("synthetic", synthetic_audio())
+    for path in args.media:
+        report(path, decode_audio(path))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,36 @@
+import os
+
+import torch
+
+# Temperatures Whisper falls back through when a window fails its quality checks.
+FALLBACK_TEMPERATURES = (0.0, 0.2, 0.4, 0.6, 0.8, 1.0)
+
+# Torch intra-op threads for single-pass decoding; 0 leaves torch's own default.
+DECODE_THREADS = int(os.environ.get("SUBTITLES_DECODE_THREADS", "0"))
+
+# Whisper decode options per profile. `fp16` of None means half precision on GPU only.
+DECODING_PROFILES = {
+    "Fast (greedy)": dict(temperature=0.0, beam_size=None, best_of=None, condition_on_previous_text=False, fp16=None),
+    "Balanced": dict(temperature=FALLBACK_TEMPERATURES, beam_size=None, best_of=2, condition_on_previous_text=True,
+                     fp16=None),
+    "Accurate (beam search)": dict(temperature=FALLBACK_TEMPERATURES, beam_size=5, best_of=5,
+                                   condition_on_previous_text=True, fp16=None),
+}
+
+DEFAULT_PROFILE = "Balanced"
+
+
+def decode_options(profile: str = DEFAULT_PROFILE, threads: int = DECODE_THREADS) -> dict:
+    """
+    Return the keyword arguments to pass to transcribe() for `profile`, with
+    `fp16` resolved for this machine. Options that are None are left out so
+    Whisper applies its own default. `threads` only changes speed, so
+    transcribe() leaves it out of the cache key.
+    """
+    if profile not in DECODING_PROFILES:
+        raise ValueError(f"Unknown decoding profile {profile}")
+    options = {key: value for key, value in DECODING_PROFILES[profile].items() if value is not None}
+    options.setdefault("fp16", torch.cuda.is_available())
+    if threads:
+        options["threads"] = threads
+    return options
@@ -0,0 +1,332 @@
+import json
+import multiprocessing
+import os
+import pathlib
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+from whisper.audio import SAMPLE_RATE
+
+from audio import decode_audio
+from pipeline import speech_segments
+from render import burn_subtitles, mux_subtitles, ENCODER_PRESETS
+from transcription_cache import hash_audio
+from workspace import WORKSPACE_ROOT, keeper, touch_workspace
+
+QUEUED, RUNNING, DONE, FAILED = "queued", "running", "done", "failed"
+
+JOBS_DB = pathlib.Path(os.environ.get("SUBTITLES_CACHE_DIR", pathlib.Path.home() / ".cache" / "subtitles")) / "jobs.sqlite3"
+
+# Worker processes started by get_queue().
+JOB_WORKERS = int(os.environ.get("SUBTITLES_JOB_WORKERS", "1"))
+
+# A running job's worker touches it every JOB_HEARTBEAT seconds; one silent for
+# JOB_LEASE seconds is taken to have died with its worker and is queued again,
+# or failed once it has been claimed JOB_ATTEMPTS times.
+JOB_HEARTBEAT = 10
+JOB_LEASE = int(os.environ.get("SUBTITLES_JOB_LEASE", "120"))
+JOB_ATTEMPTS = 2
+STALE_ERROR = "The worker running this job stopped responding"
+
+HANDLERS = {}
+
+
+def handler(kind: str):
+    """Register a function `fn(params, progress) -> result` for jobs of `kind`."""
+    def register(fn):
+        HANDLERS[kind] = fn
+        return fn
+    return register
+
+
+def _new_job(kind: str, params: dict) -> dict:
+    now = time.time()
+    return {
+        "id": uuid.uuid4().hex, "kind": kind, "params": params, "status": QUEUED,
+        "progress": 0.0, "result": None, "error": None, "created": now, "updated": now, "attempts": 0,
+    }
+
+
+class MemoryBackend:
+    """Jobs held in a dict; only usable with thread workers in the same process."""
+
+    def __init__(self):
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    def create(self, kind: str, params: dict) -> str:
+        job = _new_job(kind, params)
+        with self._lock:
+            self._jobs[job["id"]] = job
+        return job["id"]
+
+    def claim(self):
+        with self._lock:
+            now = time.time()
+            for job in self._jobs.values():
+                if job["status"] == RUNNING and job["updated"] < now - JOB_LEASE:
+                    if job["attempts"] >= JOB_ATTEMPTS:
+                        job.update(status=FAILED, error=STALE_ERROR, updated=now)
+                    else:
+                        job.update(status=QUEUED, progress=0.0, updated=now)
+            for job in sorted(self._jobs.values(), key=lambda job: job["created"]):
+                if job["status"] == QUEUED:
+                    job.update(status=RUNNING, updated=now, attempts=job["attempts"] + 1)
+                    return dict(job)
+        return None
+
+    def update(self, job_id: str, **fields):
+        with self._lock:
+            self._jobs[job_id].update(fields, updated=time.time())
+
+    def get(self, job_id: str):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return dict(job) if job is not None else None
+
+    def unfinished(self) -> list:
+        with self._lock:
+            return [job["params"] for job in self._jobs.values() if job["status"] in (QUEUED, RUNNING)]
+
+
+class SQLiteBackend:
+    """Jobs stored in a SQLite file, shared by every worker process and page."""
+
+    def __init__(self, path=JOBS_DB):
+        self.path = str(path)
+        pathlib.Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+        with self._connect() as db:
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS jobs (id TEXT PRIMARY KEY, kind TEXT, params TEXT, status TEXT,"
+                " progress REAL, result TEXT, error TEXT, created REAL, updated REAL, attempts INTEGER DEFAULT 0)"
+            )
+            if "attempts" not in [column[1] for column in db.execute("PRAGMA table_info(jobs)")]:
+                db.execute("ALTER TABLE jobs ADD COLUMN attempts INTEGER DEFAULT 0")
+
+    @contextmanager
+    def _connect(self):
+        db = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        try:
+            yield db
+        finally:
+            db.close()
+
+    def create(self, kind: str, params: dict) -> str:
+        job = _new_job(kind, params)
+        with self._connect() as db:
+            db.execute(
+                "INSERT INTO jobs (id, kind, params, status, progress, result, error, created, updated, attempts)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, 0)",
+                (job["id"], kind, json.dumps(params), QUEUED, 0.0, None, None, job["created"], job["updated"]),
+            )
+        return job["id"]
+
+    def claim(self):
+        now = time.time()
+        with self._connect() as db:
+            db.execute("BEGIN IMMEDIATE")
+            # Jobs whose worker died: fail those claimed too often, queue the rest again.
+            db.execute("UPDATE jobs SET status = ?, error = ?, updated = ? WHERE status = ? AND updated < ? AND attempts >= ?",
+                       (FAILED, STALE_ERROR, now, RUNNING, now - JOB_LEASE, JOB_ATTEMPTS))
+            db.execute("UPDATE jobs SET status = ?, progress = 0, updated = ? WHERE status = ? AND updated < ?",
+                       (QUEUED, now, RUNNING, now - JOB_LEASE))
+            row = db.execute("SELECT id FROM jobs WHERE status = ? ORDER BY created LIMIT 1", (QUEUED,)).fetchone()
+            if row is not None:
+                db.execute("UPDATE jobs SET status = ?, updated = ?, attempts = attempts + 1 WHERE id = ?",
+                           (RUNNING, now, row[0]))
+            db.execute("COMMIT")
+        return self.get(row[0]) if row is not None else None
+
+    def update(self, job_id: str, **fields):
+        fields["updated"] = time.time()
+        for key in ("params", "result"):
+            if key in fields:
+                fields[key] = json.dumps(fields[key], default=float)
+        columns = ", ".join(f"{key} = ?" for key in fields)
+        with self._connect() as db:
+            db.execute(f"UPDATE jobs SET {columns} WHERE id = ?", (*fields.values(), job_id))
+
+    def get(self, job_id: str):
+        with self._connect() as db:
+            db.row_factory = sqlite3.Row
+            row = db.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if row is None:
+            return None
+        job = dict(row)
+        job["params"] = json.loads(job["params"])
+        job["result"] = json.loads(job["result"]) if job["result"] is not None else None
+        return job
+
+    def unfinished(self) -> list:
+        """The params of the jobs that are queued or running."""
+        with self._connect() as db:
+            rows = db.execute("SELECT params FROM jobs WHERE status IN (?, ?)", (QUEUED, RUNNING)).fetchall()
+        return [json.loads(row[0]) for row in rows]
+
+
+def touch_workspace_of(job: dict):
+    if job["params"].get("workspace"):
+        touch_workspace(job["params"]["workspace"])
+
+
+def run_job(backend, job: dict):
+    def progress(fraction: float):
+        backend.update(job["id"], progress=min(max(fraction, 0.0), 1.0))
+
+    def heartbeat():
+        # Keeps the job's lease while a single window takes longer than JOB_LEASE to decode.
+        while not done.wait(JOB_HEARTBEAT):
+            backend.update(job["id"])
+            touch_workspace_of(job)
+
+    done = threading.Event()
+    beating = threading.Thread(target=heartbeat, daemon=True)
+    beating.start()
+    try:
+        result = HANDLERS[job["kind"]](job["params"], progress)
+    except Exception as e:
+        outcome = dict(status=FAILED, error=f"{type(e).__name__}: {e}")
+    else:
+        outcome = dict(status=DONE, progress=1.0, result=result)
+    done.set()
+    beating.join()
+    # The result's files are kept for a full WORKSPACE_TTL after the job ends, not after it was submitted.
+    touch_workspace_of(job)
+    backend.update(job["id"], **outcome)
+
+
+def work(backend, poll_interval: float = 0.5, stop: threading.Event = None):
+    """Claim and run jobs from `backend` until `stop` is set."""
+    while stop is None or not stop.is_set():
+        job = backend.claim()
+        if job is None:
+            time.sleep(poll_interval)
+            continue
+        run_job(backend, job)
+
+
+def _work_process(path: str):
+    work(SQLiteBackend(path))
+
+
+class JobQueue:
+    """
+    Accepts jobs, hands them to a pool of workers and reports their state.
+
+    With a SQLiteBackend the workers are separate processes, so a long
+    transcription never holds the Streamlit script thread or the GIL; with a
+    MemoryBackend they are threads of the current process.
+
+        queue = JobQueue(SQLiteBackend(), workers=2)
+        job_id = queue.submit("transcribe", {...})
+        queue.status(job_id)["progress"]
+    """
+
+    def __init__(self, backend=None, workers: int = JOB_WORKERS):
+        self.backend = backend if backend is not None else SQLiteBackend()
+        self.workers = workers
+        self._stop = threading.Event()
+        self._pool = []
+
+    def start(self):
+        if self._pool:
+            return self
+        for _ in range(self.workers):
+            if isinstance(self.backend, SQLiteBackend):
+                worker = multiprocessing.get_context("spawn").Process(
+                    target=_work_process, args=(self.backend.path,), daemon=True
+                )
+            else:
+                worker = threading.Thread(target=work, args=(self.backend, 0.5, self._stop), daemon=True)
+            worker.start()
+            self._pool.append(worker)
+        return self
+
+    def stop(self):
+        self._stop.set()
+        for worker in self._pool:
+            if isinstance(worker, multiprocessing.process.BaseProcess):
+                worker.terminate()
+            worker.join()
+        self._pool = []
+
+    def submit(self, kind: str, params: dict) -> str:
+        if kind not in HANDLERS:
+            raise ValueError(f"Unknown job kind {kind}")
+        return self.backend.create(kind, params)
+
+    def status(self, job_id: str):
+        return self.backend.get(job_id)
+
+    def result(self, job_id: str, timeout: float = None, poll_interval: float = 0.5):
+        """Wait for `job_id` to finish and return its result."""
+        deadline = None if timeout is None else time.time() + timeout
+        while True:
+            job = self.backend.get(job_id)
+            if job is None:
+                raise KeyError(job_id)
+            if job["status"] == DONE:
+                return job["result"]
+            if job["status"] == FAILED:
+                raise RuntimeError(job["error"])
+            if deadline is not None and time.time() > deadline:
+                raise TimeoutError(job_id)
+            time.sleep(poll_interval)
+
+
+_queue = None
+_queue_lock = threading.Lock()
+
+
+def get_queue() -> JobQueue:
+    """Return the process-wide queue, starting its workers on first use."""
+    global _queue
+    with _queue_lock:
+        if _queue is None:
+            _queue = JobQueue().start()
+        return _queue
+
+
+@keeper
+def _unfinished_workspaces() -> list:
+    # Inputs of queued and running jobs survive workspace reclaims from any process using the queue.
+    if _queue is not None:
+        backend = _queue.backend
+    elif JOBS_DB.exists():
+        backend = SQLiteBackend()
+    else:
+        return []
+    return [WORKSPACE_ROOT / params["workspace"] for params in backend.unfinished() if params.get("workspace")]
+
+
+@handler("transcribe")
+def transcribe_job(params: dict, progress) -> dict:
+    audio = decode_audio(params["audio"])
+    duration = max(len(audio) / SAMPLE_RATE, 1e-6)
+    # Submitters that have not looked at the audio (the HTTP API) leave hashing,
+    # and always leave language identification and model routing, to the worker.
+    segments, language = speech_segments(audio, params.get("media_hash") or hash_audio(audio),
+                                         params.get("task", "transcribe"), params["model_size"], mode="stream",
+                                         target_lang=params.get("target_lang"),
+                                         on_segment=lambda segment: progress(segment["end"] / duration),
+                                         **params.get("options", {}))
+    return {"segments": segments, "text": "".join(segment["text"] for segment in segments), "language": language}
+
+
+@handler("translate")
+def translate_job(params: dict, progress) -> dict:
+    return transcribe_job(dict(params, task="translate"), progress)
+
+
+@handler("burn")
+def burn_job(params: dict, progress) -> dict:
+    if params.get("soft"):
+        output = mux_subtitles(params["video"], params["tracks"], params["output"])
+    else:
+        output = burn_subtitles(params["video"], params["subtitles"], params["output"],
+                                **ENCODER_PRESETS[params.get("speed", "Balanced")])
+    return {"output": str(output)}
@@ -0,0 +1,74 @@
+import os
+from collections import Counter
+
+import numpy as np
+import whisper
+from whisper.audio import SAMPLE_RATE
+
+from audio import decode_audio, find_speech, speech_span
+from model_registry import get_model
+from transcription_cache import CACHE_DIR, TranscriptionCache, cache_key
+
+# Multilingual model used for language identification; tiny answers in a fraction of a second on CPU.
+LANGUAGE_ID_MODEL = os.environ.get("SUBTITLES_LANGUAGE_ID_MODEL", "tiny")
+
+# Probability at which the first window is trusted without looking at more.
+CONFIDENT = 0.8
+
+# Kept apart from the transcripts: these entries hold no segments.
+cache = TranscriptionCache(CACHE_DIR.parent / "languages", max_bytes=8 * 1024 * 1024,
+                           fields=("language", "probability", "windows"))
+
+
+def detect_language(audio, media_hash: str = None, model_size: str = LANGUAGE_ID_MODEL, windows: int = 3,
+                    window_seconds: int = 30) -> dict:
+    """
+    Identify the spoken language of `audio` (a path or a 16 kHz float32 array)
+    without transcribing it. Returns {"language", "probability", "windows"}.
+
+    Whisper's detect_language() is run on the first `window_seconds` of speech
+    (silence and music cut out, and only the windows copied out of `audio`). When that is not conclusive, up to
+    `windows` windows spread over the recording vote with their summed
+    probabilities. Results are cached by `media_hash` when one is given.
+    """
+    if model_size.endswith(".en"):
+        raise ValueError(f"{model_size} is English-only and cannot identify languages")
+    key = cache_key(media_hash, model_size, "detect_language", dict(windows=windows, window_seconds=window_seconds))
+    if media_hash is not None:
+        result = cache.get(key)
+        if result is not None:
+            return result
+
+    audio = decode_audio(audio) if isinstance(audio, str) else audio
+    regions = find_speech(audio)
+    if not len(regions):
+        regions = np.array([[0, len(audio)]], dtype=np.int64)
+    speech_length = int((regions[:, 1] - regions[:, 0]).sum())
+    window = window_seconds * SAMPLE_RATE
+    starts = [0] if speech_length <= window else np.linspace(0, speech_length - window, windows).astype(int)
+
+    model = get_model(model_size)
+    votes = Counter()
+    for count, start in enumerate(starts, start=1):
+        chunk = whisper.pad_or_trim(speech_span(audio, regions, start, window))
+        mel = whisper.log_mel_spectrogram(chunk, model.dims.n_mels).to(model.device)
+        _, probs = model.detect_language(mel)
+        votes.update(probs)
+        if count == 1 and max(probs.values()) >= CONFIDENT:
+            break
+
+    language, total = votes.most_common(1)[0]
+    result = {"language": language, "probability": total / count, "windows": count}
+    if media_hash is not None:
+        cache.put(key, result)
+    return result
+
+
+def model_for(size: str, language: str, task: str = "transcribe") -> str:
+    """
+    The model to decode with: the English-only variant of `size` when English
+    speech is transcribed (more accurate at the same cost), `size` otherwise.
+    """
+    if language == "en" and task == "transcribe" and f"{size}.en" in whisper.available_models():
+        return f"{size}.en"
+    return size
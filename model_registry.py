@@ -0,0 +1,84 @@
+import os
+import threading
+from collections import OrderedDict
+
+import whisper
+
+MODEL_SIZES = ["tiny", "base", "small", "medium", "large"]
+
+# Parameter counts of the multilingual checkpoints, as published by Whisper, so
+# the pages can describe a size without loading it.
+MODEL_PARAMETERS = {"tiny": 39_000_000, "base": 74_000_000, "small": 244_000_000, "medium": 769_000_000,
+                    "large": 1_550_000_000}
+
+# Upper bound on the resident size of all loaded models, in megabytes.
+# Least recently used sizes are dropped once a new load would exceed it.
+RAM_BUDGET_MB = int(os.environ.get("SUBTITLES_MODEL_RAM_MB", "4096"))
+
+_models = OrderedDict()
+# Bytes held (or, while a size is loading, expected to be held) by each size.
+_footprints = {}
+_lock = threading.Lock()
+# One lock per size, so two sessions asking for it load it once while other sizes are served meanwhile.
+_load_locks = {}
+
+
+def model_footprint(model) -> int:
+    """Return the number of bytes held by the model parameters and buffers."""
+    params = sum(p.numel() * p.element_size() for p in model.parameters())
+    buffers = sum(b.numel() * b.element_size() for b in model.buffers())
+    return params + buffers
+
+
+def _evict(budget: int):
+    while _models and sum(_footprints.values()) > budget:
+        size, _ = _models.popitem(last=False)
+        _footprints.pop(size, None)
+
+
+def get_model(size: str):
+    """
+    Return the Whisper model for `size`, loading it at most once per process.
+    The same instance is handed to every page and session, so callers must not
+    mutate it.
+
+    Room for the new model (its float32 parameters) is made before it is
+    loaded, so the loaded models never exceed RAM_BUDGET_MB together. Only
+    callers of the same size wait for a load.
+    """
+    with _lock:
+        if size in _models:
+            _models.move_to_end(size)
+            return _models[size]
+        load_lock = _load_locks.setdefault(size, threading.Lock())
+
+    with load_lock:
+        with _lock:
+            if size in _models:
+                _models.move_to_end(size)
+                return _models[size]
+            _footprints[size] = MODEL_PARAMETERS[size.split(".")[0]] * 4
+            _evict(RAM_BUDGET_MB * 1024 * 1024)
+
+        try:
+            model = whisper.load_model(size)
+        except BaseException:
+            with _lock:
+                _footprints.pop(size, None)
+            raise
+
+        with _lock:
+            _models[size] = model
+            _footprints[size] = model_footprint(model)
+        return model
+
+
+def loaded_sizes():
+    with _lock:
+        return list(_models.keys())
+
+
+def unload_model(size: str):
+    with _lock:
+        _models.pop(size, None)
+        _footprints.pop(size, None)
@@ -0,0 +1,66 @@
+import os
+
+import torch
+from whisper.audio import SAMPLE_RATE
+
+from language_id import model_for
+from model_registry import MODEL_SIZES
+from transcriber import refine_low_confidence
+
+AUTO = "auto"
+
+# Rough estimates of the seconds of decoding per second of audio for each size
+# on a CPU with the Balanced profile; they are not measurements. On a GPU they
+# are divided by GPU_SPEEDUP. Time a host with benchmarks/decoding_profiles.py
+# and set SUBTITLES_RTF_SCALE to calibrate both to it.
+MODEL_RTF = {"tiny": 0.05, "base": 0.1, "small": 0.3, "medium": 0.8, "large": 1.6}
+GPU_SPEEDUP = 10.0
+RTF_SCALE = float(os.environ.get("SUBTITLES_RTF_SCALE", "1.0"))
+
+# Seconds a transcription may take before a smaller model is preferred.
+LATENCY_BUDGET = float(os.environ.get("SUBTITLES_LATENCY_BUDGET", "600"))
+
+
+def estimated_seconds(size: str, duration: float) -> float:
+    rtf = MODEL_RTF[size.split(".")[0]] * RTF_SCALE
+    if torch.cuda.is_available():
+        rtf /= GPU_SPEEDUP
+    return duration * rtf
+
+
+def route(size: str, duration: float, language: str, task: str = "transcribe", budget: float = LATENCY_BUDGET):
+    """
+    Pick the model for `duration` seconds of speech in `language`. Returns
+    (model, refine_model): refine_model is the next size up to re-decode
+    low-confidence segments with, or None.
+
+    An explicit `size` is used exactly as chosen. With AUTO, the largest size
+    whose estimated decoding time fits `budget` is used; tiny is avoided for
+    languages other than English, where its error rate is much higher, unless
+    nothing else fits, and English speech is transcribed with the English-only
+    variant of the chosen size.
+    """
+    if size != AUTO:
+        return size, None
+
+    fits = [candidate for candidate in MODEL_SIZES if estimated_seconds(candidate, duration) <= budget]
+    if language != "en":
+        fits = [candidate for candidate in fits if candidate != "tiny"] or fits
+    primary = fits[-1] if fits else MODEL_SIZES[0]
+    position = MODEL_SIZES.index(primary)
+    bigger = MODEL_SIZES[position + 1] if position + 1 < len(MODEL_SIZES) else None
+    return model_for(primary, language, task), bigger and model_for(bigger, language, task)
+
+
+def refine(audio, results: dict, model: str, refine_model: str, budget: float = LATENCY_BUDGET, **options) -> dict:
+    """
+    Second pass of a route(): re-decode the low-confidence segments of
+    `results` with `refine_model`, as many as fit in what is left of `budget`
+    after `model` decoded the whole of `audio`. A no-op without refine_model.
+    """
+    if refine_model is None:
+        return results
+    duration = len(audio) / SAMPLE_RATE
+    left = max(budget - estimated_seconds(model, duration), 0.0)
+    return refine_low_confidence(audio, results, refine_model,
+                                 max_seconds=left / estimated_seconds(refine_model, 1.0), **options)
@@ -1,21 +1,24 @@
-import whisper
 import streamlit as st
 from streamlit_lottie import st_lottie
-from utils import write_vtt, write_srt
+from utils import format_srt
+from model_registry import MODEL_SIZES, MODEL_PARAMETERS
+from transcription_cache import hash_audio, hash_bytes, hash_file
+from audio import decode_audio
+from workspace import session_workspace
+from jobs import get_queue, QUEUED, RUNNING, FAILED
+from render import burn_subtitles, mux_subtitles, ENCODER_PRESETS
 from flores200_codes import flores_codes
-import ffmpeg
+from segmentation import CAPTION_LAYOUTS
+from decoding import DECODING_PROFILES, DEFAULT_PROFILE
+from model_router import AUTO, LATENCY_BUDGET
+from pipeline import speech_segments, speech_options, make_subtitles
+from languages import LANGUAGES
 import requests
-from typing import Iterator
 from io import StringIO
-import numpy as np
-import pathlib
-import os
+import time
 
 st.set_page_config(page_title="Semaitles", page_icon=":movie_camera:", layout="wide")
 
-# Sema Translator
-Public_Url = 'https://lewiskimaru-helloworld.hf.space' #endpoint
-
 # Define a function that we can use to load lottie files from a link.
 @st.cache(allow_output_mutation=True)
 def load_lottieurl(url: str):
@@ -25,18 +28,6 @@ def load_lottieurl(url: str):
     return r.json()
 
 
-APP_DIR = pathlib.Path(__file__).parent.absolute()
-
-LOCAL_DIR = APP_DIR / "local"
-LOCAL_DIR.mkdir(exist_ok=True)
-save_dir = LOCAL_DIR / "output"
-save_dir.mkdir(exist_ok=True)
-
-
-loaded_model = whisper.load_model("base")
-current_size = "None"
-
-
 col1, col2 = st.columns([1, 3])
 with col1:
     lottie = load_lottieurl("https://assets1.lottiefiles.com/packages/lf20_HjK9Ol.json")
@@ -51,93 +42,119 @@ with col2:
     ###### ➠ If you want to translate the subtitles from English to any of the 200 supported languages, select the task as "Translate with Sema" """)
 
 
-@st.cache(allow_output_mutation=True)
-def change_model(current_size, size):
-    if current_size != size:
-        loaded_model = whisper.load_model(size)
-        return loaded_model
-    else:
-        raise Exception("Model size is the same as the current size.")
+def extract_audio(uploaded_file):
+    audio = decode_audio(uploaded_file)
+    return audio, hash_audio(audio)
+
+
+def save_video(uploaded_file, workspace):
+    with open(workspace.file("input.mp4"), "wb") as f:
+            f.write(uploaded_file.getvalue())
+    return workspace.file("input.mp4")
 
 
 @st.cache(allow_output_mutation=True)
-def inferecence(loaded_model, uploaded_file, task):
-    with open(f"{save_dir}/input.mp4", "wb") as f:
-            f.write(uploaded_file.read())
-    audio = ffmpeg.input(f"{save_dir}/input.mp4")
-    audio = ffmpeg.output(audio, f"{save_dir}/output.wav", acodec="pcm_s16le", ac=1, ar="16k")
-    ffmpeg.run(audio, overwrite_output=True)
-    if task == "Transcribe":
-        options = dict(task="transcribe", best_of=5)
-        results = loaded_model.transcribe(f"{save_dir}/output.wav", **options)
-        vtt = getSubs(results["segments"], "vtt", 80)
-        srt = getSubs(results["segments"], "srt", 80)
-        lang = results["language"]
-        return results["text"], vtt, srt, lang
-    elif task == "Translate":
-        options = dict(task="translate", best_of=5)
-        results = loaded_model.transcribe(f"{save_dir}/output.wav", **options)
-        vtt = getSubs(results["segments"], "vtt", 80)
-        srt = getSubs(results["segments"], "srt", 80)
-        lang = results["language"]
-        return results["text"], vtt, srt, lang
-    else:
+def inferecence(size, uploaded_file, task, parallel=False, layout="Whisper segments", vad=False, profile=DEFAULT_PROFILE):
+    if task not in ("Transcribe", "Translate", "Translate with Whisper"):
         raise ValueError("Task not supported")
+    audio, media_hash = extract_audio(uploaded_file)
+    segments, language = speech_segments(audio, media_hash, "transcribe" if task == "Transcribe" else "translate", size,
+                                         mode="parallel" if parallel else "single", **speech_options(layout, vad, profile))
+    return make_subtitles(segments, layout), language
 
 
-def getSubs(segments: Iterator[dict], format: str, maxLineWidth: int) -> str:
-    segmentStream = StringIO()
+def stream_inferecence(size, uploaded_file, task, layout="Whisper segments", vad=False, profile=DEFAULT_PROFILE, target_code=None):
+    # Show the SRT as each window is decoded instead of after the whole file.
+    audio, media_hash = extract_audio(uploaded_file)
+    placeholder = st.empty()
+    srt_stream = StringIO()
 
-    if format == 'vtt':
-        write_vtt(segments, file=segmentStream, maxLineWidth=maxLineWidth)
-    elif format == 'srt':
-        write_srt(segments, file=segmentStream, maxLineWidth=maxLineWidth)
-    else:
-        raise Exception("Unknown format " + format)
+    def show(segment):
+        srt_stream.write(format_srt([segment], maxLineWidth=80, start_index=segment["id"] + 1))
+        with placeholder.container():
+            st.code(srt_stream.getvalue())
+            st.download_button(label="Download Partial Transcript (.srt)",
+                            data=srt_stream.getvalue(),
+                            file_name="transcript_partial.srt",
+                            key=f"partial_srt_{segment['id']}")
+
+    segments, language = speech_segments(audio, media_hash, "transcribe" if task == "Transcribe" else "translate", size,
+                                         mode="stream", on_segment=show, target_lang=target_code,
+                                         **speech_options(layout, vad, profile))
+    placeholder.empty()
+    return make_subtitles(segments, layout), language
+
+
+def background_job(kind, params, key, workspace):
+    # Run on the job queue so a rerun reattaches to the job instead of restarting it.
+    queue = get_queue()
+    jobs = st.session_state.setdefault("jobs", {})
+    if key not in jobs:
+        jobs[key] = queue.submit(kind, dict(params, workspace=workspace.id))
+    bar = st.progress(0.0, text="Waiting for a worker")
+    job = queue.status(jobs[key])
+    while job["status"] in (QUEUED, RUNNING):
+        bar.progress(job["progress"], text=f"{job['status'].capitalize()} ({job['progress']:.0%})")
+        time.sleep(1)
+        job = queue.status(jobs[key])
+    bar.empty()
+    if job["status"] == FAILED:
+        del jobs[key]
+        raise RuntimeError(job["error"])
+    return job["result"]
 
-    segmentStream.seek(0)
-    return segmentStream.read()
 
+def background_inferecence(size, uploaded_file, task, workspace, layout="Whisper segments", vad=False, profile=DEFAULT_PROFILE, target_code=None):
+    # Only the upload is saved here; the worker decodes it and identifies its language.
+    kind = "transcribe" if task == "Transcribe" else "translate"
+    key = f"{kind}:{size}:{profile}:{layout}:{vad}:{target_code}:{hash_bytes(uploaded_file.getvalue())}"
+    results = background_job(kind, dict(audio=save_video(uploaded_file, workspace), model_size=size, target_lang=target_code,
+                                        options=speech_options(layout, vad, profile)), key, workspace)
+    return make_subtitles(results["segments"], layout), results["language"]
 
-def generate_subtitled_video(video, audio, transcript):
-    video_file = ffmpeg.input(video)
-    audio_file = ffmpeg.input(audio)
-    ffmpeg.concat(video_file.filter("subtitles", transcript), audio_file, v=1, a=1).output("final.mp4").run(quiet=True, overwrite_output=True)
-    video_with_subs = open("final.mp4", "rb")
+
+@st.cache(allow_output_mutation=True)
+def sema_inferecence(size, uploaded_file, target_code, parallel=False, layout="Whisper segments", vad=False, profile=DEFAULT_PROFILE):
+    # Transcribe in the original language, then translate each segment with Sema keeping its timing.
+    audio, media_hash = extract_audio(uploaded_file)
+    segments, language = speech_segments(audio, media_hash, "transcribe", size, mode="parallel" if parallel else "single",
+                                         target_lang=target_code, **speech_options(layout, vad, profile))
+    return make_subtitles(segments, layout), language
+
+
+VIDEO_OUTPUTS = ["Burned-in subtitles", "Subtitle track (MP4)", "Subtitle track (MKV)"]
+
+
+def generate_subtitled_video(video, transcript, workspace, speed="Balanced", background=False):
+    if background:
+        key = f"burn:{speed}:{hash_file(video)}:{hash_file(transcript)}"
+        background_job("burn", dict(video=video, subtitles=transcript, speed=speed, output=workspace.file("final.mp4")), key, workspace)
+    else:
+        burn_subtitles(video, transcript, workspace.file("final.mp4"), **ENCODER_PRESETS[speed])
+    video_with_subs = open(workspace.file("final.mp4"), "rb")
     return video_with_subs
 
-def translate(userinput, target_lang, source_lang=None):
-    if source_lang:
-       url = f"{Public_Url}/translate_enter/"
-       data = {
-           "userinput": userinput,
-           "source_lang": source_lang,
-           "target_lang": target_lang,
-        }
-       response = requests.post(url, json=data)
-       result = response.json()
-       print(type(result))
-       source_lange = source_lang
-       translation = result['translated_text']
-       
+
+def generate_soft_subtitled_video(video, tracks, workspace, container="mp4", background=False):
+    if background:
+        key = f"mux:{container}:{hash_file(video)}:" + ",".join(f"{hash_file(path)}/{language}" for path, language in tracks)
+        background_job("burn", dict(video=video, tracks=tracks, soft=True, output=workspace.file(f"final.{container}")), key, workspace)
     else:
-      url = f"{Public_Url}/translate_detect/"
-      data = {
-        "userinput": userinput,
-        "target_lang": target_lang,
-      }
-
-      response = requests.post(url, json=data)
-      result = response.json()
-      source_lange = result['source_language']
-      translation = result['translated_text']
-    return source_lange, translation
+        mux_subtitles(video, tracks, workspace.file(f"final.{container}"))
+    video_with_subs = open(workspace.file(f"final.{container}"), "rb")
+    return video_with_subs
+
     
 def main():
-    size = st.selectbox("Select Model Size (The larger the model, the more accurate the transcription will be, but it will take longer)", ["tiny", "base", "small", "medium", "large"], index=1)
-    loaded_model = change_model(current_size, size)
-    st.write(f"Model is {'multilingual' if loaded_model.is_multilingual else 'English-only'} "
-        f"and has {sum(np.prod(p.shape) for p in loaded_model.parameters()):,} parameters.")
+    workspace = session_workspace(st.session_state)
+    size = st.selectbox("Select Model Size (The larger the model, the more accurate the transcription will be, but it will take longer)", [AUTO] + MODEL_SIZES, index=0)
+    profile = st.selectbox("Decoding Profile (Fast decodes greedily, Accurate uses beam search and takes longest)", list(DECODING_PROFILES.keys()), index=list(DECODING_PROFILES.keys()).index(DEFAULT_PROFILE))
+    if size == AUTO:
+        st.write(f"The largest model expected to finish within {LATENCY_BUDGET / 60:.0f} minutes is picked for each file, "
+            "and the segments it is unsure of are decoded again with the next size up.")
+    else:
+        st.write(f"The {size} model is multilingual, has about {MODEL_PARAMETERS[size] / 1e6:,.0f} million parameters "
+            "and is used as chosen whatever the language.")
     input_file = st.file_uploader("File", type=["mp4", "avi", "mov", "mkv"])
     # get the name of the input_file
     if input_file is not None:
@@ -145,32 +162,29 @@ def main():
     else:
         filename = None
     task = st.selectbox("Select Task", ["Transcribe", "Translate with Whisper", "Translate with Sema"], index=0)
+    mode = st.selectbox("Processing Mode (Parallel splits long media at silences and uses every CPU core)", ["Live subtitles", "Single pass", "Parallel", "Background"], index=0)
+    layout = st.selectbox("Subtitle Layout (Broadcast splits cues at word timings into short, readable lines)", list(CAPTION_LAYOUTS.keys()), index=0)
+    vad = st.checkbox("Skip silence and music (only the stretches with speech are transcribed, which is faster on long recordings)", value=True)
+    speed = st.selectbox("Render Speed (Fast renders quicker at lower video quality)", list(ENCODER_PRESETS.keys()), index=1)
+    output = st.selectbox("Video Output (Subtitle tracks skip re-encoding and can be switched on and off in the player)", VIDEO_OUTPUTS, index=0)
     if task == "Transcribe":
         if st.button("Transcribe"):
-            results = inferecence(loaded_model, input_file, task)
+            if mode == "Live subtitles":
+                results = stream_inferecence(size, input_file, task, layout, vad, profile)
+            elif mode == "Background":
+                results = background_inferecence(size, input_file, task, workspace, layout, vad, profile)
+            else:
+                results = inferecence(size, input_file, task, parallel=mode == "Parallel", layout=layout, vad=vad, profile=profile)
             col3, col4 = st.columns(2)
             col5, col6, col7, col8 = st.columns(4)
             col9, col10 = st.columns(2)
             with col3:
                 st.video(input_file)
                 
-            with open("transcript.txt", "w+", encoding='utf8') as f:
-                f.writelines(results[0])
-                f.close()
-            with open(os.path.join(os.getcwd(), "transcript.txt"), "rb") as f:
-                datatxt = f.read()
-                
-            with open("transcript.vtt", "w+",encoding='utf8') as f:
-                f.writelines(results[1])
-                f.close()
-            with open(os.path.join(os.getcwd(), "transcript.vtt"), "rb") as f:
-                datavtt = f.read()
-                
-            with open("transcript.srt", "w+",encoding='utf8') as f:
-                f.writelines(results[2])
-                f.close()
-            with open(os.path.join(os.getcwd(), "transcript.srt"), "rb") as f:
-                datasrt = f.read()
+            # The downloads are served from memory; only the .srt is written, for ffmpeg.
+            datatxt, datavtt, datasrt = (results[0][format] for format in ("txt", "vtt", "srt"))
+            with open(workspace.file("transcript.srt"), "wb") as f:
+                f.write(datasrt)
 
             with col5:
                 st.download_button(label="Download Transcript (.txt)",
@@ -191,39 +205,38 @@ def main():
                         
             with col4:
                 with st.spinner("Generating Subtitled Video"):
-                    video_with_subs = generate_subtitled_video(f"{save_dir}/input.mp4", f"{save_dir}/output.wav", "transcript.srt")
-                st.video(video_with_subs)
+                    video = save_video(input_file, workspace)
+                    if output == "Burned-in subtitles":
+                        container = "mp4"
+                        video_with_subs = generate_subtitled_video(video, workspace.file("transcript.srt"), workspace, speed, mode == "Background")
+                    else:
+                        container = "mkv" if output.endswith("(MKV)") else "mp4"
+                        video_with_subs = generate_soft_subtitled_video(video, [(workspace.file("transcript.srt"), LANGUAGES.get(results[1], "und"))], workspace, container, mode == "Background")
+                if container == "mp4":
+                    st.video(video_with_subs)
                 st.snow()
             with col8:
                 st.download_button(label="Download Video with Subtitles",
                                 data=video_with_subs,
-                                file_name=f"{filename}_with_subs.mp4")
+                                file_name=f"{filename}_with_subs.{container}")
     elif task == "Translate with Whisper":
         if st.button("Translate to English"):
-            results = inferecence(loaded_model, input_file, task)
+            if mode == "Live subtitles":
+                results = stream_inferecence(size, input_file, task, layout, vad, profile)
+            elif mode == "Background":
+                results = background_inferecence(size, input_file, task, workspace, layout, vad, profile)
+            else:
+                results = inferecence(size, input_file, task, parallel=mode == "Parallel", layout=layout, vad=vad, profile=profile)
             col3, col4 = st.columns(2)
             col5, col6, col7, col8 = st.columns(4)
             col9, col10 = st.columns(2)
             with col3:
                 st.video(input_file)
                 
-            with open("transcript.txt", "w+", encoding='utf8') as f:
-                f.writelines(results[0])
-                f.close()
-            with open(os.path.join(os.getcwd(), "transcript.txt"), "rb") as f:
-                datatxt = f.read()
-                
-            with open("transcript.vtt", "w+",encoding='utf8') as f:
-                f.writelines(results[1])
-                f.close()
-            with open(os.path.join(os.getcwd(), "transcript.vtt"), "rb") as f:
-                datavtt = f.read()
-                
-            with open("transcript.srt", "w+",encoding='utf8') as f:
-                f.writelines(results[2])
-                f.close()
-            with open(os.path.join(os.getcwd(), "transcript.srt"), "rb") as f:
-                datasrt = f.read()
+            # The downloads are served from memory; only the .srt is written, for ffmpeg.
+            datatxt, datavtt, datasrt = (results[0][format] for format in ("txt", "vtt", "srt"))
+            with open(workspace.file("transcript.srt"), "wb") as f:
+                f.write(datasrt)
                 
             with col5:
                 st.download_button(label="Download Transcript (.txt)",
@@ -244,19 +257,77 @@ def main():
                         
             with col4:
                 with st.spinner("Generating Subtitled Video"):
-                    video_with_subs = generate_subtitled_video(f"{save_dir}/input.mp4", f"{save_dir}/output.wav", "transcript.srt")
-                st.video(video_with_subs)
+                    video = save_video(input_file, workspace)
+                    if output == "Burned-in subtitles":
+                        container = "mp4"
+                        video_with_subs = generate_subtitled_video(video, workspace.file("transcript.srt"), workspace, speed, mode == "Background")
+                    else:
+                        container = "mkv" if output.endswith("(MKV)") else "mp4"
+                        video_with_subs = generate_soft_subtitled_video(video, [(workspace.file("transcript.srt"), "eng")], workspace, container, mode == "Background")
+                if container == "mp4":
+                    st.video(video_with_subs)
                 st.snow()
             with col8:
                 st.download_button(label="Download Video with Subtitles ",
                                 data=video_with_subs,
-                                file_name=f"{filename}_with_subs.mp4")
+                                file_name=f"{filename}_with_subs.{container}")
                 
     elif task == "Translate with Sema":
         default_language = "French"
         target = st.selectbox("Select Language", list(flores_codes.keys()), index=list(flores_codes.keys()).index(default_language))
         target_code = flores_codes[target]
-        
+        if st.button("Translate with Sema"):
+            # Every mode transcribes in the original language; Sema translates the finished segments.
+            if mode == "Live subtitles":
+                results = stream_inferecence(size, input_file, "Transcribe", layout, vad, profile, target_code)
+            elif mode == "Background":
+                results = background_inferecence(size, input_file, "Transcribe", workspace, layout, vad, profile, target_code)
+            else:
+                results = sema_inferecence(size, input_file, target_code, parallel=mode == "Parallel", layout=layout, vad=vad, profile=profile)
+            col3, col4 = st.columns(2)
+            col5, col6, col7, col8 = st.columns(4)
+            col9, col10 = st.columns(2)
+            with col3:
+                st.video(input_file)
+                
+            # The downloads are served from memory; only the .srt is written, for ffmpeg.
+            datatxt, datavtt, datasrt = (results[0][format] for format in ("txt", "vtt", "srt"))
+            with open(workspace.file("transcript.srt"), "wb") as f:
+                f.write(datasrt)
+
+            with col5:
+                st.download_button(label="Download Transcript (.txt)",
+                                data=datatxt,
+                                file_name="transcript.txt")
+            with col6:   
+                st.download_button(label="Download Transcript (.vtt)",
+                                    data=datavtt,
+                                    file_name="transcript.vtt")
+            with col7:
+                st.download_button(label="Download Transcript (.srt)",
+                                    data=datasrt,
+                                    file_name="transcript.srt")
+            with col9:
+                st.success("You can download the transcript in .srt format, edit it (if you need to) and upload it to YouTube to create subtitles for your video.")
+            with col10:
+                st.info("Streamlit refreshes after the download button is clicked. The data is cached so you can download the transcript again without having to transcribe the video again.")
+                        
+            with col4:
+                with st.spinner("Generating Subtitled Video"):
+                    video = save_video(input_file, workspace)
+                    if output == "Burned-in subtitles":
+                        container = "mp4"
+                        video_with_subs = generate_subtitled_video(video, workspace.file("transcript.srt"), workspace, speed, mode == "Background")
+                    else:
+                        container = "mkv" if output.endswith("(MKV)") else "mp4"
+                        video_with_subs = generate_soft_subtitled_video(video, [(workspace.file("transcript.srt"), target_code.split("_")[0])], workspace, container, mode == "Background")
+                if container == "mp4":
+                    st.video(video_with_subs)
+                st.snow()
+            with col8:
+                st.download_button(label="Download Video with Subtitles",
+                                data=video_with_subs,
+                                file_name=f"{filename}_with_subs.{container}")
     else:
         st.error("Please select a task.")
 
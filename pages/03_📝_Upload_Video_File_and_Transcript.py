@@ -1,21 +1,17 @@
 import streamlit as st
 from streamlit_lottie import st_lottie
-from utils import write_vtt, write_srt
+from utils import export_subtitles, parse_subtitles
 from flores200_codes import flores_codes
-import ffmpeg
+from sema import translate_segments
+from workspace import session_workspace
+from render import burn_subtitles, mux_subtitles, ENCODER_PRESETS
 import requests
-from typing import Iterator
-from io import StringIO
+from io import BytesIO
 import numpy as np
-import pathlib
-import os
 
 
 st.set_page_config(page_title="Captions", page_icon=":movie_camera:", layout="wide")
 
-# Sema Translator
-Public_Url = 'https://lewiskimaru-helloworld.hf.space' #endpoint
-
 # Define a function that we can use to load lottie files from a link.
 @st.cache(allow_output_mutation=True)
 def load_lottieurl(url: str):
@@ -25,14 +21,6 @@ def load_lottieurl(url: str):
     return r.json()
 
 
-APP_DIR = pathlib.Path(__file__).parent.absolute()
-
-LOCAL_DIR = APP_DIR / "local_transcript"
-LOCAL_DIR.mkdir(exist_ok=True)
-save_dir = LOCAL_DIR / "output"
-save_dir.mkdir(exist_ok=True)
-
-
 col1, col2 = st.columns([1, 3])
 with col1:
     lottie = load_lottieurl("https://assets6.lottiefiles.com/packages/lf20_cjnxwrkt.json")
@@ -45,55 +33,31 @@ with col2:
     ##### ➠ Processing time will increase as the video length increases. """)
 
 
-def getSubs(segments: Iterator[dict], format: str, maxLineWidth: int) -> str:
-    segmentStream = StringIO()
+VIDEO_OUTPUTS = ["Burned-in subtitles", "Subtitle track (MP4)", "Subtitle track (MKV)"]
+
+
+def save_video(uploaded_file, workspace):
+    with open(workspace.file("input.mp4"), "wb") as f:
+            f.write(uploaded_file.getvalue())
+    return workspace.file("input.mp4")
+
+
+KEEP_LANGUAGE = "Keep original language"
+
+
+def translate_transcript(transcript, format, target_code, workspace):
+    # Translate each cue with Sema, keeping its timing, and write it next to the original.
+    with open(transcript, "r", encoding="utf8") as f:
+        segments = list(parse_subtitles(f))
+    source_lang, segments = translate_segments(segments, target_code)
+    translated = workspace.file(f"translated_transcript.{format}")
+    with open(translated, "wb") as f:
+        f.write(export_subtitles(segments, (format,), 80)[format])
+    return translated
 
-    if format == 'vtt':
-        write_vtt(segments, file=segmentStream, maxLineWidth=maxLineWidth)
-    elif format == 'srt':
-        write_srt(segments, file=segmentStream, maxLineWidth=maxLineWidth)
-    else:
-        raise Exception("Unknown format " + format)
-
-    segmentStream.seek(0)
-    return segmentStream.read()
-
-
-def split_video_audio(uploaded_file):
-    with open(f"{save_dir}/input.mp4", "wb") as f:
-            f.write(uploaded_file.read())
-    audio = ffmpeg.input(f"{save_dir}/input.mp4")
-    audio = ffmpeg.output(audio, f"{save_dir}/output.wav", acodec="pcm_s16le", ac=1, ar="16k")
-    ffmpeg.run(audio, overwrite_output=True)
-
-def translate(userinput, target_lang, source_lang=None):
-    if source_lang:
-       url = f"{Public_Url}/translate_enter/"
-       data = {
-           "userinput": userinput,
-           "source_lang": source_lang,
-           "target_lang": target_lang,
-        }
-       response = requests.post(url, json=data)
-       result = response.json()
-       print(type(result))
-       source_lange = source_lang
-       translation = result['translated_text']
-       
-    else:
-      url = f"{Public_Url}/translate_detect/"
-      data = {
-        "userinput": userinput,
-        "target_lang": target_lang,
-      }
-
-      response = requests.post(url, json=data)
-      result = response.json()
-      source_lange = result['source_language']
-      translation = result['translated_text']
-    return source_lange, translation
 
 def main():
+    workspace = session_workspace(st.session_state)
     uploaded_video = st.file_uploader("Upload Video File", type=["mp4", "avi", "mov", "mkv"])
     # get the name of the input_file
     if uploaded_video is not None:
@@ -105,50 +69,79 @@ def main():
         transcript_name = transcript_file.name
     else:
         transcript_name = None
+    speed = st.selectbox("Render Speed (Fast renders quicker at lower video quality)", list(ENCODER_PRESETS.keys()), index=1)
+    target = st.selectbox("Translate Subtitles with Sema", [KEEP_LANGUAGE] + list(flores_codes.keys()), index=0)
+    output = st.selectbox("Video Output (Subtitle tracks skip re-encoding and can be switched on and off in the player)", VIDEO_OUTPUTS, index=0)
     if uploaded_video is not None and transcript_file is not None:
         if transcript_name[-3:] == "vtt":
-            with open("uploaded_transcript.vtt", "wb") as f:
-                f.writelines(transcript_file)
-                f.close()
-            with open(os.path.join(os.getcwd(), "uploaded_transcript.vtt"), "rb") as f:
-                vtt_file = f.read()
+            with open(workspace.file("uploaded_transcript.vtt"), "wb") as f:
+                f.write(transcript_file.getvalue())
+            if not any(True for _ in parse_subtitles(BytesIO(transcript_file.getvalue()))):
+                st.error("No subtitles could be read from the transcript file. Please check that it is a valid .vtt file")
             if st.button("Generate Video with Subtitles"):
+                subtitles, language = workspace.file("uploaded_transcript.vtt"), "und"
+                if target != KEEP_LANGUAGE:
+                    with st.spinner("Translating Subtitles"):
+                        subtitles, language = translate_transcript(subtitles, "vtt", flores_codes[target], workspace), flores_codes[target].split("_")[0]
+                tracks = [(subtitles, language)] + ([(workspace.file("uploaded_transcript.vtt"), "und")] if target != KEEP_LANGUAGE else [])
                 with st.spinner("Generating Subtitled Video"):
-                    split_video_audio(uploaded_video)
-                    video_file = ffmpeg.input(f"{save_dir}/input.mp4")
-                    audio_file = ffmpeg.input(f"{save_dir}/output.wav")
-                    ffmpeg.concat(video_file.filter("subtitles", "uploaded_transcript.vtt"), audio_file, v=1, a=1).output("final.mp4").global_args('-report').run(quiet=True, overwrite_output=True)
-                    video_with_subs = open("final.mp4", "rb")
+                    video = save_video(uploaded_video, workspace)
+                    if output == "Burned-in subtitles":
+                        container = "mp4"
+                        burn_subtitles(video, subtitles, workspace.file("final.mp4"), **ENCODER_PRESETS[speed])
+                    else:
+                        container = "mkv" if output.endswith("(MKV)") else "mp4"
+                        mux_subtitles(video, tracks, workspace.file(f"final.{container}"))
+                    video_with_subs = open(workspace.file(f"final.{container}"), "rb")
                 col3, col4 = st.columns(2)
                 with col3:
                     st.video(uploaded_video)
                 with col4:
-                    st.video(video_with_subs)
+                    if container == "mp4":
+                        st.video(video_with_subs)
                 st.download_button(label="Download Video with Subtitles",
                                     data=video_with_subs,
-                                    file_name=f"{filename}_with_subs.mp4")
+                                    file_name=f"{filename}_with_subs.{container}")
+                if target != KEEP_LANGUAGE:
+                    with open(subtitles, "rb") as f:
+                        st.download_button(label="Download Translated Subtitles (.vtt)",
+                                            data=f.read(),
+                                            file_name=f"{filename}_{flores_codes[target]}.vtt")
 
         elif transcript_name[-3:] == "srt":
-            with open("uploaded_transcript.srt", "wb") as f:
-                f.writelines(transcript_file)
-                f.close()
-            with open(os.path.join(os.getcwd(), "uploaded_transcript.srt"), "rb") as f:
-                srt_file = f.read()
+            with open(workspace.file("uploaded_transcript.srt"), "wb") as f:
+                f.write(transcript_file.getvalue())
+            if not any(True for _ in parse_subtitles(BytesIO(transcript_file.getvalue()))):
+                st.error("No subtitles could be read from the transcript file. Please check that it is a valid .srt file")
             if st.button("Generate Video with Subtitles"):
+                subtitles, language = workspace.file("uploaded_transcript.srt"), "und"
+                if target != KEEP_LANGUAGE:
+                    with st.spinner("Translating Subtitles"):
+                        subtitles, language = translate_transcript(subtitles, "srt", flores_codes[target], workspace), flores_codes[target].split("_")[0]
+                tracks = [(subtitles, language)] + ([(workspace.file("uploaded_transcript.srt"), "und")] if target != KEEP_LANGUAGE else [])
                 with st.spinner("Generating Subtitled Video"):
-                    split_video_audio(uploaded_video)
-                    video_file = ffmpeg.input(f"{save_dir}/input.mp4")
-                    audio_file = ffmpeg.input(f"{save_dir}/output.wav")
-                    ffmpeg.concat(video_file.filter("subtitles",  "uploaded_transcript.srt"), audio_file, v=1, a=1).output("final.mp4").run(quiet=True, overwrite_output=True)
-                    video_with_subs = open("final.mp4", "rb")
+                    video = save_video(uploaded_video, workspace)
+                    if output == "Burned-in subtitles":
+                        container = "mp4"
+                        burn_subtitles(video, subtitles, workspace.file("final.mp4"), **ENCODER_PRESETS[speed])
+                    else:
+                        container = "mkv" if output.endswith("(MKV)") else "mp4"
+                        mux_subtitles(video, tracks, workspace.file(f"final.{container}"))
+                    video_with_subs = open(workspace.file(f"final.{container}"), "rb")
                 col3, col4 = st.columns(2)
                 with col3:
                     st.video(uploaded_video)
                 with col4:
-                    st.video(video_with_subs)
+                    if container == "mp4":
+                        st.video(video_with_subs)
                 st.download_button(label="Download Video with Subtitles",
                                     data=video_with_subs,
-                                    file_name=f"{filename}_with_subs.mp4")
+                                    file_name=f"{filename}_with_subs.{container}")
+                if target != KEEP_LANGUAGE:
+                    with open(subtitles, "rb") as f:
+                        st.download_button(label="Download Translated Subtitles (.srt)",
+                                            data=f.read(),
+                                            file_name=f"{filename}_{flores_codes[target]}.srt")
         else:
             st.error("Please upload a .srt or .vtt file")
     else:
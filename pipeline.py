@@ -0,0 +1,252 @@
+import itertools
+import json
+import multiprocessing
+import os
+import pathlib
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+from whisper.audio import SAMPLE_RATE
+
+from audio import decode_audio
+from decoding import DEFAULT_PROFILE, decode_options
+from flores200_codes import flores_codes
+from language_id import detect_language
+from model_router import AUTO, refine, route
+from segmentation import CAPTION_LAYOUTS, resegment
+from sema import flores_source, translate_segments
+from transcriber import TranscriptionStream, parallel_transcribe, transcribe
+from transcription_cache import hash_audio, hash_bytes
+from utils import export_subtitles
+from youtube import load_audio
+from youtube_metadata import video_id
+
+MEDIA_EXTENSIONS = {".mp3", ".mp4", ".m4a", ".wav", ".flac", ".ogg", ".webm", ".mkv", ".mov", ".avi"}
+
+# Files read as lists of sources, one media path or YouTube link per line.
+LIST_EXTENSIONS = {".txt", ".list", ".jsonl"}
+
+DEFAULT_LAYOUT = next(iter(CAPTION_LAYOUTS))
+
+MANIFEST = "manifest.jsonl"
+
+
+def speech_options(layout: str = DEFAULT_LAYOUT, vad: bool = True, profile: str = DEFAULT_PROFILE) -> dict:
+    """The decoder options for a caption `layout`, with or without `vad`, under a decoding `profile`."""
+    return dict(word_timestamps=CAPTION_LAYOUTS[layout] is not None, vad=vad, **decode_options(profile))
+
+
+def speech_segments(audio, media_hash: str = None, task: str = "transcribe", model_size: str = AUTO,
+                    mode: str = "single", language: str = None, duration: float = None, target_lang: str = None,
+                    on_segment=None, **options) -> tuple:
+    """
+    The steps every interface runs on speech: identify the language of
+    `audio` unless `language` is given, pick the model for `model_size` (see
+    route()), decode, re-decode the segments it was unsure of and, with a
+    FLORES-200 `target_lang`, translate the result with Sema. Returns
+    (segments, spoken language).
+
+    `mode` is "single" (one pass), "parallel" (chunks split at silences and
+    decoded across processes) or "stream" (window by window, calling
+    `on_segment(segment)` as soon as each is decoded). In stream mode `audio`
+    may also be an iterable of blocks still arriving; the language is then
+    identified on the first block, and `duration` has to be given.
+    """
+    if isinstance(audio, np.ndarray):
+        duration = len(audio) / SAMPLE_RATE if duration is None else duration
+        if language is None:
+            language = detect_language(audio, media_hash)["language"]
+    else:
+        if mode != "stream" or duration is None:
+            raise ValueError("Audio still arriving in blocks needs mode='stream' and its duration")
+        blocks = iter(audio)
+        first = next(blocks)
+        if language is None:
+            language = detect_language(first)["language"]
+        audio = itertools.chain([first], blocks)
+
+    model, refine_model = route(model_size, duration, language, task)
+    options = dict(options, task=task, language=language)
+    if mode == "stream":
+        stream = TranscriptionStream(audio, model, media_hash, **options)
+        for segment in stream:
+            if on_segment is not None:
+                on_segment(segment)
+        results, audio = stream.result(), stream.audio
+    else:
+        results = (parallel_transcribe if mode == "parallel" else transcribe)(audio, model, media_hash, **options)
+    results = refine(audio, results, model, refine_model, **options)
+
+    segments = results["segments"]
+    if target_lang:
+        _, segments = translate_segments(segments, target_lang, flores_source("en" if task == "translate" else language))
+    return segments, language
+
+
+def make_subtitles(segments, layout: str = DEFAULT_LAYOUT, formats=("txt", "vtt", "srt")) -> dict:
+    """Export `segments` in each of `formats`, laid out as the caption `layout` asks."""
+    # Resegmented cues come back already wrapped to the layout's line length.
+    style = CAPTION_LAYOUTS[layout]
+    if style is None:
+        return export_subtitles(segments, formats, maxLineWidth=80)
+    return export_subtitles(resegment(segments, **style), formats)
+
+
+def is_link(source: str) -> bool:
+    return source.startswith(("http://", "https://"))
+
+
+def _name(source: str) -> str:
+    if not is_link(source):
+        return pathlib.Path(source).stem
+    try:
+        return video_id(source)
+    except ValueError:
+        # Not a YouTube link; process() reports it, the name only has to be unique.
+        return hash_bytes(source.encode("utf8"))[:12]
+
+
+def collect_sources(inputs) -> dict:
+    """
+    Expand `inputs` (media files, YouTube links, directories searched
+    recursively for media, and list files) into {source: name}, de-duplicated
+    and in order. A line of a .jsonl list is either a JSON object with a
+    "source" key or a bare path or link; blank lines and lines starting with #
+    are skipped.
+
+    The name is where the outputs go: a file found in a directory keeps its
+    path relative to that directory (minus the extension), a link its video
+    ID, anything else its stem. A name already taken gets a short hash of the
+    source appended, so no two sources write to the same place.
+    """
+    found = []
+    for item in inputs:
+        path = pathlib.Path(item)
+        if is_link(item):
+            found.append((item, _name(item)))
+        elif path.is_dir():
+            found.extend((str(f), str(f.relative_to(path).with_suffix("")))
+                         for f in sorted(path.rglob("*")) if f.suffix.lower() in MEDIA_EXTENSIONS)
+        elif path.suffix.lower() in LIST_EXTENSIONS:
+            for line in path.read_text(encoding="utf8").splitlines():
+                line = line.strip()
+                if not line or line.startswith("#"):
+                    continue
+                source = json.loads(line)["source"] if line.startswith("{") else line
+                found.append((source, _name(source)))
+        else:
+            found.append((str(path), _name(str(path))))
+
+    sources, taken = {}, set()
+    for source, name in found:
+        if source in sources:
+            continue
+        if name in taken:
+            name = f"{name}-{hash_bytes(source.encode('utf8'))[:8]}"
+        sources[source] = name
+        taken.add(name)
+    return sources
+
+
+def read_manifest(output_dir) -> dict:
+    """Return {source: entry} for the last recorded outcome of each source under `output_dir`."""
+    entries = {}
+    path = pathlib.Path(output_dir) / MANIFEST
+    if not path.exists():
+        return entries
+    with open(path, encoding="utf8") as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:
+                # A line cut short by a crash; that source is simply run again.
+                continue
+            entries[entry["source"]] = entry
+    return entries
+
+
+def _record(output_dir, entry: dict):
+    path = pathlib.Path(output_dir) / MANIFEST
+    # Start on a fresh line if a crash left the last one unfinished.
+    partial = False
+    if path.exists() and path.stat().st_size:
+        with open(path, "rb") as f:
+            f.seek(-1, os.SEEK_END)
+            partial = f.read(1) != b"\n"
+    with open(path, "a", encoding="utf8") as f:
+        f.write(("\n" if partial else "") + json.dumps(entry, ensure_ascii=False) + "\n")
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def process(source: str, output_dir, name: str = None, task: str = "transcribe", model_size: str = AUTO,
+            profile: str = DEFAULT_PROFILE, layout: str = DEFAULT_LAYOUT, vad: bool = True,
+            target_lang: str = None, formats=("srt", "vtt", "txt")) -> dict:
+    """
+    Transcribe (or, with task="translate", translate to English) one media
+    file or YouTube link, optionally translate the result with Sema to the
+    FLORES-200 `target_lang`, and write each of `formats` to
+    `output_dir/<name>/<last part of name>.<language>.<format>`. `name`
+    defaults to the video ID of a link or the stem of a file (see
+    collect_sources()). Returns the manifest entry.
+    """
+    name = name or _name(source)
+    audio = load_audio(source) if is_link(source) else decode_audio(source)
+    segments, language = speech_segments(audio, hash_audio(audio), task, model_size, target_lang=target_lang,
+                                         **speech_options(layout, vad, profile))
+    output_lang = target_lang or ("en" if task == "translate" else language)
+    # Recorded in the manifest; route() answers the same as it did inside speech_segments().
+    model = route(model_size, len(audio) / SAMPLE_RATE, language, task)[0]
+
+    exports = make_subtitles(segments, layout, formats)
+    directory = pathlib.Path(output_dir) / name
+    directory.mkdir(parents=True, exist_ok=True)
+    outputs = []
+    for format, data in exports.items():
+        path = directory / f"{pathlib.Path(name).name}.{output_lang}.{format}"
+        path.write_bytes(data)
+        outputs.append(str(path))
+    return {"source": source, "status": "done", "language": language, "model": model, "outputs": outputs}
+
+
+def _process(source: str, name: str, output_dir, options: dict) -> dict:
+    # Runs in a worker process; failures are reported as manifest entries.
+    started = time.time()
+    try:
+        entry = process(source, output_dir, name, **options)
+    except Exception as e:
+        entry = {"source": source, "status": "failed", "error": f"{type(e).__name__}: {e}"}
+    entry["seconds"] = round(time.time() - started, 1)
+    return entry
+
+
+def run(inputs, output_dir, jobs: int = 1, retry_failed: bool = False, on_result=None, **options) -> dict:
+    """
+    Process every source in `inputs` (see collect_sources()) with up to
+    `jobs` worker processes, each loading its own models, and record each
+    outcome in `output_dir/manifest.jsonl` as soon as it is known.
+
+    Sources the manifest already marks done are skipped, so an interrupted
+    run picks up where it stopped; failed ones are skipped too unless
+    `retry_failed`. `on_result(entry)` is called in this process for each
+    finished source. Returns counts of done, failed and skipped sources.
+    """
+    pathlib.Path(output_dir).mkdir(parents=True, exist_ok=True)
+    if options.get("target_lang") in flores_codes:
+        options["target_lang"] = flores_codes[options["target_lang"]]
+    finished = read_manifest(output_dir)
+    skip = {"done"} | (set() if retry_failed else {"failed"})
+    sources = collect_sources(inputs)
+    pending = [source for source in sources if finished.get(source, {}).get("status") not in skip]
+    counts = {"done": 0, "failed": 0, "skipped": len(sources) - len(pending)}
+
+    with ProcessPoolExecutor(max_workers=jobs, mp_context=multiprocessing.get_context("spawn")) as pool:
+        futures = [pool.submit(_process, source, sources[source], str(output_dir), options) for source in pending]
+        for future in as_completed(futures):
+            entry = future.result()
+            _record(output_dir, entry)
+            counts[entry["status"]] += 1
+            if on_result is not None:
+                on_result(entry)
+    return counts
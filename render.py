@@ -0,0 +1,59 @@
+import os
+
+import ffmpeg
+
+# Encoder threads for burn-in; 0 lets x264 pick based on the core count.
+RENDER_THREADS = int(os.environ.get("SUBTITLES_RENDER_THREADS", "0"))
+
+# x264 settings offered in the pages, from fastest to best looking.
+ENCODER_PRESETS = {
+    "Fast": dict(preset="ultrafast", crf=28),
+    "Balanced": dict(preset="veryfast", crf=23),
+    "Quality": dict(preset="medium", crf=18),
+}
+
+
+def burn_subtitles(video, subtitles, output, preset: str = "veryfast", crf: int = 23, threads: int = RENDER_THREADS):
+    """
+    Hard-burn `subtitles` (SRT/VTT path) into `video` and write `output`.
+
+    The source is read once: only the video stream goes through the
+    `subtitles` filter and x264, the original audio is stream-copied. Audio that
+    the output container cannot hold as-is is re-encoded to AAC instead.
+    """
+    source = ffmpeg.input(str(video))
+    picture = source.video.filter("subtitles", str(subtitles))
+    encoder = dict(vcodec="libx264", preset=preset, crf=crf, threads=threads, movflags="+faststart")
+    try:
+        ffmpeg.output(picture, str(output), acodec="copy", map="0:a?", **encoder).run(quiet=True, overwrite_output=True)
+    except ffmpeg.Error:
+        ffmpeg.output(picture, str(output), acodec="aac", map="0:a?", **encoder).run(quiet=True, overwrite_output=True)
+    return output
+
+
+def has_audio(video) -> bool:
+    return any(stream["codec_type"] == "audio" for stream in ffmpeg.probe(str(video))["streams"])
+
+
+def mux_subtitles(video, tracks, output):
+    """
+    Add subtitle files to `video` as player-selectable streams without
+    re-encoding anything. `tracks` is a list of (path, language) pairs, the
+    language being an ISO 639-2 code such as "eng". MP4/MOV outputs carry the
+    tracks as mov_text, anything else (MKV) as WebVTT.
+    """
+    source = ffmpeg.input(str(video))
+    streams = [source.video]
+    if has_audio(video):
+        streams.append(source.audio)
+
+    metadata = {}
+    for i, (path, language) in enumerate(tracks):
+        streams.append(ffmpeg.input(str(path))["s"])
+        metadata[f"metadata:s:s:{i}"] = f"language={language}"
+
+    scodec = "mov_text" if str(output).lower().endswith((".mp4", ".m4v", ".mov")) else "webvtt"
+    ffmpeg.output(*streams, str(output), vcodec="copy", acodec="copy", scodec=scodec, **metadata).run(
+        quiet=True, overwrite_output=True
+    )
+    return output
@@ -0,0 +1,126 @@
+import re
+from typing import Iterator
+
+# Readability limits for each subtitle layout offered in the UI; None keeps Whisper's own segments.
+CAPTION_LAYOUTS = {
+    "Broadcast (2 lines of 42)": dict(max_chars=42, max_lines=2, max_cps=17.0, min_duration=1.0, max_duration=7.0),
+    "Single line (32)": dict(max_chars=32, max_lines=1, max_cps=17.0, min_duration=0.8, max_duration=4.0),
+    "Whisper segments": None,
+}
+
+_SENTENCE_END = re.compile(r"[.!?…。！？]['\"”’)\]]*$")
+_TOKEN = re.compile(r"\s*\S+")
+
+
+def _words(segment: dict) -> Iterator[dict]:
+    """
+    The words of `segment` with their timing. Segments transcribed without
+    word_timestamps (or parsed from a subtitle file, or translated) have their
+    duration shared out over their words in proportion to length.
+    """
+    if segment.get("words"):
+        yield from segment["words"]
+        return
+    tokens = _TOKEN.findall(segment["text"].replace("\n", " "))
+    total = sum(len(token.strip()) for token in tokens)
+    start, duration = segment["start"], segment["end"] - segment["start"]
+    for token in tokens:
+        end = start + duration * len(token.strip()) / total
+        yield {"word": token, "start": start, "end": end}
+        start = end
+
+
+class _Cue:
+    def __init__(self, word: dict):
+        self.start = word["start"]
+        self.end = word["end"]
+        self.lines = [[word["word"].lstrip()]]
+        self.line_chars = len(self.lines[0][0])
+        self.chars = self.line_chars
+        self.last = word["word"]
+
+    def fits(self, word: str, max_chars: int, max_lines: int) -> bool:
+        return self.line_chars + len(word) <= max_chars or len(self.lines) < max_lines
+
+    def too_dense(self, word: dict, max_cps: float, min_duration: float) -> bool:
+        # Whether `word` would take the reading rate past max_cps. A cue is not
+        # ended before min_duration: with speech faster than max_cps throughout,
+        # splitting could not lower the rate and would only make cues flicker.
+        # Nor is it when no time has passed, where no split could lower it either.
+        duration = word["end"] - self.start
+        if duration <= 0 or self.end - self.start < min_duration:
+            return False
+        return (self.chars + len(word["word"])) / duration > max_cps
+
+    def add(self, word: dict, max_chars: int):
+        text = word["word"]
+        if self.line_chars + len(text) > max_chars:
+            text = text.lstrip()
+            self.lines.append([text])
+            self.line_chars = len(text)
+        else:
+            self.lines[-1].append(text)
+            self.line_chars += len(text)
+        self.chars += len(text)
+        self.end = max(self.end, word["end"])
+        self.last = text
+
+    def text(self) -> str:
+        return "\n".join("".join(line).strip() for line in self.lines)
+
+
+def resegment(segments, max_chars: int = 42, max_lines: int = 2, max_cps: float = 17.0,
+              min_duration: float = 1.0, max_duration: float = 7.0, pause: float = 1.0,
+              min_gap: float = 0.08) -> Iterator[dict]:
+    """
+    Regroup a transcript into subtitle cues that respect readability limits,
+    using the word timestamps Whisper returns with `word_timestamps=True`.
+
+    Words are laid out greedily into lines of at most `max_chars` characters
+    and cues of at most `max_lines` lines and `max_duration` seconds. A cue
+    also ends before a word that would take it past `max_cps` characters per
+    second, after a sentence once it has been on screen for `min_duration`,
+    and at any silence longer than `pause`. Cues that are still too short or
+    too dense are held on screen longer, into the gap before the next cue but
+    no closer than `min_gap`.
+
+    The text of each cue is already wrapped, so write it out without another
+    maxLineWidth. Every word is looked at once and cues are yielded as soon as
+    the next one starts, so a live TranscriptionStream can be resegmented too.
+    """
+    cue = None
+    pending = None
+    index = 0
+
+    def timed(cue: _Cue, next_start: float = None) -> dict:
+        target = cue.start + max(min_duration, cue.chars / max_cps)
+        limit = cue.start + max_duration
+        if next_start is not None:
+            limit = min(limit, next_start - min_gap)
+        return {"id": index, "start": cue.start, "end": max(cue.end, min(target, limit)), "text": cue.text()}
+
+    for segment in segments:
+        for word in _words(segment):
+            if not word["word"].strip():
+                continue
+            if cue is not None and (
+                not cue.fits(word["word"], max_chars, max_lines)
+                or word["end"] - cue.start > max_duration
+                or cue.too_dense(word, max_cps, min_duration)
+                or word["start"] - cue.end > pause
+                or (_SENTENCE_END.search(cue.last) and cue.end - cue.start >= min_duration)
+            ):
+                if pending is not None:
+                    yield timed(pending, cue.start)
+                    index += 1
+                pending, cue = cue, None
+            if cue is None:
+                cue = _Cue(word)
+            else:
+                cue.add(word, max_chars)
+
+    if pending is not None:
+        yield timed(pending, cue.start if cue is not None else None)
+        index += 1
+    if cue is not None:
+        yield timed(cue)
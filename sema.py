@@ -0,0 +1,162 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from flores200_codes import flores_codes
+from languages import LANGUAGES
+from translation_memory import TranslationMemory, normalize
+
+# Sema Translator
+SEMA_URL = os.environ.get("SEMA_URL", "https://lewiskimaru-helloworld.hf.space")
+
+# Requests in flight at once against the Sema endpoint.
+SEMA_CONCURRENCY = int(os.environ.get("SEMA_CONCURRENCY", "8"))
+
+
+class SemaClient:
+    """
+    Client for the Sema `translate_enter/` and `translate_detect/` endpoints.
+
+    Connections are pooled and kept alive across calls, failed requests are
+    retried with exponential backoff, and translate_batch() packs many short
+    texts into a few newline-joined requests sent concurrently. Point
+    `base_url` at a local stub server to exercise it without the real service.
+
+    With a `memory`, segments translated before are served from it and only
+    the distinct unseen ones reach the endpoint.
+    """
+
+    def __init__(self, base_url: str = SEMA_URL, concurrency: int = SEMA_CONCURRENCY, batch_chars: int = 2000,
+                 timeout: float = 60, retries: int = 3, backoff: float = 0.5, memory: TranslationMemory = None):
+        self.base_url = base_url.rstrip("/")
+        self.memory = memory
+        self.concurrency = concurrency
+        self.batch_chars = batch_chars
+        self.timeout = timeout
+        retry = Retry(
+            total=retries,
+            backoff_factor=backoff,
+            status_forcelist=(429, 500, 502, 503, 504),
+            allowed_methods=frozenset({"POST"}),
+        )
+        adapter = HTTPAdapter(pool_connections=concurrency, pool_maxsize=concurrency, max_retries=retry)
+        self.session = requests.Session()
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def translate(self, userinput: str, target_lang: str, source_lang: str = None):
+        """Translate one text. Returns (source_lang, translation); the source is detected when not given."""
+        if self.memory is not None:
+            translation = self.memory.lookup(userinput, source_lang, target_lang)
+            if translation is not None:
+                return source_lang, translation
+            source, translation = self._post(userinput, target_lang, source_lang)
+            self.memory.store(userinput, source_lang, target_lang, translation)
+            return source, translation
+        return self._post(userinput, target_lang, source_lang)
+
+    def _post(self, userinput: str, target_lang: str, source_lang: str = None):
+        if source_lang:
+            url = f"{self.base_url}/translate_enter/"
+            data = {"userinput": userinput, "source_lang": source_lang, "target_lang": target_lang}
+        else:
+            url = f"{self.base_url}/translate_detect/"
+            data = {"userinput": userinput, "target_lang": target_lang}
+
+        response = self.session.post(url, json=data, timeout=self.timeout)
+        response.raise_for_status()
+        result = response.json()
+        return result.get("source_language", source_lang), result["translated_text"]
+
+    def _batches(self, texts: list) -> list:
+        batches, batch, size = [], [], 0
+        for i, text in enumerate(texts):
+            if not text:
+                continue
+            if batch and size + len(text) > self.batch_chars:
+                batches.append(batch)
+                batch, size = [], 0
+            batch.append(i)
+            size += len(text) + 1
+        if batch:
+            batches.append(batch)
+        return batches
+
+    def translate_batch(self, texts: list, target_lang: str, source_lang: str = None):
+        """
+        Translate a list of texts, returning (source_lang, translations) with
+        translations in the same order as `texts`.
+
+        Repeated texts are translated once. Each request carries one text per line. If the endpoint merges or splits
+        lines so the count no longer matches, that batch is translated one text
+        at a time instead.
+        """
+        texts = [normalize(text) for text in texts]
+        known = self.memory.lookup_many(texts, source_lang, target_lang) if self.memory is not None else {}
+        pending = list(dict.fromkeys(text for text in texts if text and text not in known))
+        translations = [""] * len(pending)
+        detected = [source_lang]
+        lock = threading.Lock()
+
+        def run(batch):
+            source, translated = self._post("\n".join(pending[i] for i in batch), target_lang, source_lang)
+            lines = translated.split("\n")
+            if len(lines) != len(batch):
+                lines = [self._post(pending[i], target_lang, source)[1] for i in batch]
+            with lock:
+                detected[0] = detected[0] or source
+            for i, line in zip(batch, lines):
+                translations[i] = line.strip()
+
+        with ThreadPoolExecutor(max_workers=self.concurrency) as pool:
+            list(pool.map(run, self._batches(pending)))
+        if self.memory is not None and pending:
+            self.memory.store_many(zip(pending, translations), source_lang, target_lang)
+        known.update(zip(pending, translations))
+        return detected[0], [known.get(text, "") for text in texts]
+
+
+_client = None
+
+
+def get_client() -> SemaClient:
+    global _client
+    if _client is None:
+        _client = SemaClient(memory=TranslationMemory())
+    return _client
+
+
+def translate(userinput, target_lang, source_lang=None):
+    return get_client().translate(userinput, target_lang, source_lang)
+
+
+def flores_source(language: str):
+    """
+    Map a Whisper language code ("en") to the FLORES-200 code Sema expects
+    ("eng_Latn"), or None when there is no single match and Sema should detect
+    the language itself.
+    """
+    iso = LANGUAGES.get(language)
+    matches = [code for code in flores_codes.values() if code.split("_")[0] == iso]
+    return matches[0] if len(matches) == 1 else None
+
+
+def translate_segments(segments, target_lang: str, source_lang: str = None, client: SemaClient = None):
+    """
+    Translate the text of each segment to `target_lang`, keeping its `start`
+    and `end`. All segments go through one translate_batch() call, so the
+    requests run concurrently and a long transcript costs about as much
+    latency as its slowest batch. Returns (source_lang, segments).
+    """
+    client = client or get_client()
+    segments = list(segments)
+    source, texts = client.translate_batch([segment["text"] for segment in segments], target_lang, source_lang)
+    translated = [
+        {"id": i, "start": segment["start"], "end": segment["end"], "text": text}
+        for i, (segment, text) in enumerate(zip(segments, texts))
+    ]
+    return source, translated
@@ -0,0 +1,56 @@
+"""
+Generate subtitles for many files without the web app.
+
+    python subtitles.py archive/ links.txt -o subtitles/ --jobs 2
+    python subtitles.py talk.mp4 --translate-to French --formats srt vtt
+
+Inputs are media files, YouTube links, directories (searched recursively)
+and list files with one path or link per line. Each result is written to
+OUTPUT/<name>/, where name is a file's path below the directory it was
+found in or a video's ID, and OUTPUT/manifest.jsonl records every finished
+source: rerunning the same command after a crash skips what is already done.
+"""
+import argparse
+import sys
+
+from decoding import DECODING_PROFILES, DEFAULT_PROFILE
+from model_registry import MODEL_SIZES
+from model_router import AUTO
+from pipeline import DEFAULT_LAYOUT, run
+from segmentation import CAPTION_LAYOUTS
+from utils import SUBTITLE_FORMATS
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="subtitles", description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("inputs", nargs="+", help="media files, YouTube links, directories or list files")
+    parser.add_argument("-o", "--output", default="subtitles", help="output directory (default: %(default)s)")
+    parser.add_argument("--task", default="transcribe", choices=["transcribe", "translate"],
+                        help="translate: Whisper's translation to English")
+    parser.add_argument("--model", default=AUTO, choices=[AUTO] + MODEL_SIZES)
+    parser.add_argument("--profile", default=DEFAULT_PROFILE, choices=list(DECODING_PROFILES))
+    parser.add_argument("--layout", default=DEFAULT_LAYOUT, choices=list(CAPTION_LAYOUTS))
+    parser.add_argument("--no-vad", action="store_true", help="decode silence and music too")
+    parser.add_argument("--translate-to", metavar="LANGUAGE",
+                        help="translate the subtitles with Sema (FLORES-200 name or code, e.g. French or fra_Latn)")
+    parser.add_argument("--formats", nargs="+", default=["srt", "vtt", "txt"], choices=SUBTITLE_FORMATS)
+    parser.add_argument("--jobs", type=int, default=1, help="files processed at once, one process each")
+    parser.add_argument("--retry-failed", action="store_true", help="run sources that failed last time again")
+    args = parser.parse_args()
+
+    def report(entry):
+        if entry["status"] == "done":
+            print(f"done    {entry['source']} ({entry['language']}, {entry['model']}, {entry['seconds']} s)")
+        else:
+            print(f"failed  {entry['source']}: {entry['error']}", file=sys.stderr)
+
+    counts = run(args.inputs, args.output, jobs=args.jobs, retry_failed=args.retry_failed, on_result=report,
+                 task=args.task, model_size=args.model, profile=args.profile, layout=args.layout,
+                 vad=not args.no_vad, target_lang=args.translate_to, formats=tuple(args.formats))
+    print(f"{counts['done']} done, {counts['failed']} failed, {counts['skipped']} skipped")
+    return 1 if counts["failed"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
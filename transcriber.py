@@ -0,0 +1,358 @@
+import multiprocessing
+import os
+import threading
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+
+import numpy as np
+import torch
+from whisper.audio import SAMPLE_RATE
+
+from audio import compact_speech, decode_audio, find_speech, split_on_silence, to_original
+from model_registry import MODEL_PARAMETERS, RAM_BUDGET_MB, get_model
+from transcription_cache import TranscriptionCache, cache_key, hash_audio
+
+cache = TranscriptionCache()
+
+# Number of processes used by parallel_transcribe(), each with its own model.
+PARALLEL_WORKERS = int(os.environ.get("SUBTITLES_WORKERS", os.cpu_count() or 1))
+
+
+# Timeline of audio that speech_only() left whole.
+_NO_CUTS = np.zeros((1, 2), dtype=np.int64)
+
+
+def _key_options(options: dict, vad: bool) -> dict:
+    return dict(options, vad=True) if vad else options
+
+
+@contextmanager
+def _threads(count: int = None):
+    # Torch's thread count is per process, so it is restored once decoding is done.
+    if not count:
+        yield
+        return
+    previous = torch.get_num_threads()
+    torch.set_num_threads(count)
+    try:
+        yield
+    finally:
+        torch.set_num_threads(previous)
+
+
+def speech_only(audio: np.ndarray):
+    """
+    Cut the silence and music out of `audio` before decoding. Returns the
+    shortened audio and the timeline restore_segment() needs to put segments
+    back on the original one. Audio in which no speech is found is kept whole.
+    """
+    regions = find_speech(audio)
+    if len(regions) == 0:
+        return audio, _NO_CUTS
+    return compact_speech(audio, regions)
+
+
+def transcribe(audio, model_size: str, media_hash: str, task: str = "transcribe", vad: bool = False,
+               **options) -> dict:
+    """
+    Run Whisper on `audio` (a path or a 16 kHz float32 array), reusing a cached
+    result when the same media was already processed with the same model size,
+    task and decode options. With `vad`, only the stretches that hold speech
+    are decoded. A `threads` option sets the torch threads used for decoding.
+    """
+    threads = options.pop("threads", None)
+    key = cache_key(media_hash, model_size, task, _key_options(options, vad))
+    results = cache.get(key)
+    if results is not None:
+        return results
+
+    if vad:
+        audio, timeline = speech_only(decode_audio(audio) if isinstance(audio, str) else audio)
+    with _threads(threads):
+        results = get_model(model_size).transcribe(audio, task=task, **options)
+    if vad:
+        results["segments"] = [restore_segment(segment, timeline) for segment in results["segments"]]
+    cache.put(key, results)
+    return results
+
+
+def shift_segment(segment: dict, offset: float, id: int = None) -> dict:
+    """Return a copy of `segment` with its (and its words') timestamps moved by `offset` seconds."""
+    shifted = dict(segment, start=segment["start"] + offset, end=segment["end"] + offset)
+    if id is not None:
+        shifted["id"] = id
+    if "words" in segment:
+        shifted["words"] = [
+            dict(word, start=word["start"] + offset, end=word["end"] + offset) for word in segment["words"]
+        ]
+    return shifted
+
+
+def restore_segment(segment: dict, timeline: np.ndarray, id: int = None) -> dict:
+    """Return a copy of `segment` with its (and its words') times in speech_only() audio mapped back to the original."""
+    restored = dict(segment, start=to_original(segment["start"], timeline),
+                    end=to_original(segment["end"], timeline, end=True))
+    if id is not None:
+        restored["id"] = id
+    if "words" in segment:
+        restored["words"] = [
+            dict(word, start=to_original(word["start"], timeline), end=to_original(word["end"], timeline, end=True))
+            for word in segment["words"]
+        ]
+    return restored
+
+
+def _unsure(segment: dict, min_logprob: float, max_compression: float, max_no_speech: float) -> bool:
+    return ((segment.get("avg_logprob", 0.0) < min_logprob or segment.get("compression_ratio", 0.0) > max_compression)
+            and segment.get("no_speech_prob", 0.0) < max_no_speech)
+
+
+def refine_low_confidence(audio, results: dict, model_size: str, task: str = "transcribe", max_seconds: float = None,
+                          min_logprob: float = -1.0, max_compression: float = 2.4, max_no_speech: float = 0.6,
+                          padding: float = 0.2, **options) -> dict:
+    """
+    Decode again, with `model_size`, the segments of `results` that Whisper
+    was unsure of (a low average log-probability or a repetitive, highly
+    compressible text) and splice the new segments in their place.
+
+    Runs of unsure segments are decoded together with `padding` seconds of
+    context; new segments centred outside the run are dropped. With
+    `max_seconds`, the least confident runs are taken first until their
+    total length would pass it. The number of runs redone is returned as
+    `refined`.
+    """
+    audio = decode_audio(audio) if isinstance(audio, str) else audio
+    segments = results["segments"]
+    runs = []
+    for i, segment in enumerate(segments):
+        if not _unsure(segment, min_logprob, max_compression, max_no_speech):
+            continue
+        if runs and runs[-1][1] == i - 1:
+            runs[-1][1] = i
+        else:
+            runs.append([i, i])
+
+    chosen, total = [], 0.0
+    for first, last in sorted(runs, key=lambda run: min(s.get("avg_logprob", 0.0) for s in segments[run[0]:run[1] + 1])):
+        length = segments[last]["end"] - segments[first]["start"]
+        if max_seconds is not None and total + length > max_seconds:
+            continue
+        chosen.append((first, last))
+        total += length
+
+    replacements = {}
+    for first, last in chosen:
+        start, end = segments[first]["start"], segments[last]["end"]
+        offset = max(start - padding, 0.0)
+        chunk = audio[int(offset * SAMPLE_RATE):int((end + padding) * SAMPLE_RATE)]
+        redone = transcribe(chunk, model_size, hash_audio(chunk), task, **options)
+        kept = [
+            shift_segment(segment, offset) for segment in redone["segments"]
+            if start <= offset + (segment["start"] + segment["end"]) / 2 <= end
+        ]
+        if kept:
+            replacements[first] = (last, kept)
+
+    refined, i = [], 0
+    while i < len(segments):
+        if i in replacements:
+            last, kept = replacements[i]
+            refined.extend(kept)
+            i = last + 1
+        else:
+            refined.append(segments[i])
+            i += 1
+    refined = [dict(segment, id=id) for id, segment in enumerate(refined)]
+    return dict(results, segments=refined, text="".join(segment["text"] for segment in refined),
+                refined=len(replacements))
+
+
+class TranscriptionStream:
+    """
+    Transcribe audio window by window and yield segments as soon as each window
+    is decoded, with timestamps on the original timeline. Windows of at most
+    `window_seconds` end in a silence where there is one, so words are not cut.
+
+    Each window is cached on its own, so a rerun that interrupted the stream
+    replays the finished windows instantly and resumes where it stopped. The
+    language detected on the first window is reused for the rest, and the text
+    of the previous window is passed as the prompt of the next one. With
+    `vad`, silence and music are cut out before the audio is windowed.
+
+    `audio` may also be an iterable of float32 blocks still being decoded
+    (see youtube.stream_audio()): windows are then cut as the blocks arrive,
+    `vad` is applied to each window on its own, and `audio` holds the whole
+    array once the stream is exhausted.
+
+        stream = TranscriptionStream(path, "base", media_hash)
+        write_srt(stream, file=srt)
+        stream.language, stream.segments
+    """
+
+    def __init__(self, audio, model_size: str, media_hash: str, task: str = "transcribe",
+                 window_seconds: int = 30, vad: bool = False, **options):
+        self.audio = audio
+        self.model_size = model_size
+        self.media_hash = media_hash
+        self.task = task
+        self.window_seconds = window_seconds
+        self.vad = vad
+        self.threads = options.pop("threads", None)
+        self.options = options
+        self.language = options.get("language")
+        self.segments = []
+
+    def _transcribe_window(self, chunk, start: int, options: dict) -> dict:
+        key = cache_key(self.media_hash, self.model_size, self.task,
+                        _key_options(dict(options, window=(start, len(chunk))), self.vad))
+        results = cache.get(key)
+        if results is None:
+            with _threads(self.threads):
+                results = get_model(self.model_size).transcribe(chunk, task=self.task, **options)
+            cache.put(key, results)
+        return results
+
+    def _split(self, audio):
+        # Cut at the silence nearest 80% of a window so no word straddles two windows.
+        return split_on_silence(audio, chunk_seconds=0.8 * self.window_seconds, max_seconds=self.window_seconds)
+
+    def _windows(self):
+        # (chunk, start, offset in seconds, timeline) for each window to decode.
+        window = self.window_seconds * SAMPLE_RATE
+        if isinstance(self.audio, (str, np.ndarray)):
+            audio = decode_audio(self.audio) if isinstance(self.audio, str) else self.audio
+            audio, timeline = speech_only(audio) if self.vad else (audio, _NO_CUTS)
+            for start, end in self._split(audio):
+                if end > start:
+                    yield audio[start:end], start, start / SAMPLE_RATE, timeline
+            return
+
+        received, pending, start = [], np.zeros(0, np.float32), 0
+        for block in self.audio:
+            received.append(block)
+            pending = np.concatenate([pending, block])
+            while len(pending) > window:
+                _, end = self._split(pending)[0]
+                yield self._raw_window(pending[:end], start)
+                pending, start = pending[end:], start + end
+        if len(pending):
+            yield self._raw_window(pending, start)
+        self.audio = np.concatenate(received) if received else pending
+
+    def _raw_window(self, chunk, start: int):
+        # The timeline maps times in the (compacted) chunk straight to the whole recording.
+        chunk, timeline = speech_only(chunk) if self.vad else (chunk, _NO_CUTS)
+        timeline = timeline.copy()
+        timeline[:, 1] += start
+        return chunk, start, 0.0, timeline
+
+    def __iter__(self):
+        options = dict(self.options)
+        self.segments = []
+
+        for chunk, start, offset, timeline in self._windows():
+            if self.language is not None:
+                options["language"] = self.language
+            results = self._transcribe_window(chunk, start, options)
+            self.language = results["language"]
+            options["initial_prompt"] = results["text"][-200:] or None
+
+            for segment in results["segments"]:
+                segment = restore_segment(shift_segment(segment, offset), timeline, id=len(self.segments))
+                self.segments.append(segment)
+                yield segment
+
+    @property
+    def text(self) -> str:
+        return "".join(segment["text"] for segment in self.segments)
+
+    def result(self) -> dict:
+        return {"segments": self.segments, "text": self.text, "language": self.language}
+
+
+_pool = None
+_pool_key = None
+_pool_lock = threading.RLock()
+_worker_model_size = None
+
+
+def _init_worker(model_size: str, threads: int):
+    global _worker_model_size
+    torch.set_num_threads(threads)
+    _worker_model_size = model_size
+    get_model(model_size)
+
+
+def _transcribe_chunk(chunk, task: str, options: dict) -> dict:
+    results = get_model(_worker_model_size).transcribe(chunk, task=task, **options)
+    return {"segments": results["segments"], "text": results["text"], "language": results["language"]}
+
+
+def pool_workers(model_size: str, workers: int) -> int:
+    """`workers`, lowered so that one float32 copy of the model per process fits in RAM_BUDGET_MB."""
+    copy_bytes = MODEL_PARAMETERS[model_size.split(".")[0]] * 4
+    return max(1, min(workers, RAM_BUDGET_MB * 1024 * 1024 // copy_bytes))
+
+
+def get_pool(model_size: str, workers: int) -> ProcessPoolExecutor:
+    """
+    Return the pool of worker processes for `model_size`, each holding its own
+    copy of the model. Only one pool is kept: asking for another size or
+    worker count shuts the previous one down once its queued chunks are done.
+    """
+    global _pool, _pool_key
+    workers = pool_workers(model_size, workers)
+    with _pool_lock:
+        if _pool_key != (model_size, workers):
+            if _pool is not None:
+                _pool.shutdown(wait=False)
+            threads = max(1, (os.cpu_count() or 1) // workers)
+            _pool = ProcessPoolExecutor(
+                max_workers=workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_worker,
+                initargs=(model_size, threads),
+            )
+            _pool_key = (model_size, workers)
+        return _pool
+
+
+def parallel_transcribe(audio, model_size: str, media_hash: str, task: str = "transcribe",
+                        workers: int = None, chunk_seconds: int = 300, vad: bool = False, **options) -> dict:
+    """
+    Split `audio` at silences into chunks of about `chunk_seconds`, transcribe
+    them across a process pool and stitch the segments back together on the
+    original timeline. The reported language is the one detected on most of
+    the audio. With `vad`, silence and music are cut out before splitting.
+    """
+    # Each pool process already gets its share of the CPU cores.
+    options.pop("threads", None)
+    key = cache_key(media_hash, model_size, task, _key_options(dict(options, chunk_seconds=chunk_seconds), vad))
+    results = cache.get(key)
+    if results is not None:
+        return results
+
+    audio = decode_audio(audio) if isinstance(audio, str) else audio
+    audio, timeline = speech_only(audio) if vad else (audio, _NO_CUTS)
+    bounds = split_on_silence(audio, chunk_seconds=chunk_seconds, max_seconds=chunk_seconds * 1.2)
+    # Submitted under the pool lock so another size cannot shut the pool down in between.
+    with _pool_lock:
+        pool = get_pool(model_size, workers or PARALLEL_WORKERS)
+        futures = [pool.submit(_transcribe_chunk, audio[start:end], task, options) for start, end in bounds]
+
+    segments = []
+    languages = Counter()
+    for (start, end), future in zip(bounds, futures):
+        chunk = future.result()
+        languages[chunk["language"]] += end - start
+        for segment in chunk["segments"]:
+            segments.append(restore_segment(shift_segment(segment, start / SAMPLE_RATE), timeline, id=len(segments)))
+
+    results = {
+        "segments": segments,
+        "text": "".join(segment["text"] for segment in segments),
+        "language": languages.most_common(1)[0][0],
+    }
+    cache.put(key, results)
+    return results
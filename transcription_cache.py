@@ -0,0 +1,95 @@
+import hashlib
+import json
+import os
+import pathlib
+import threading
+
+CACHE_DIR = pathlib.Path(os.environ.get("SUBTITLES_CACHE_DIR", pathlib.Path.home() / ".cache" / "subtitles")) / "transcripts"
+
+# Total size of the cached results on disk, in megabytes.
+MAX_CACHE_MB = int(os.environ.get("SUBTITLES_CACHE_MB", "512"))
+
+
+def hash_bytes(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def hash_file(path, chunk_size: int = 1 << 20) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def hash_audio(audio) -> str:
+    """Hash decoded PCM, so the same audio in different containers shares a key."""
+    return hash_bytes(audio.tobytes())
+
+
+def cache_key(media_hash: str, model_size: str, task: str, options: dict) -> str:
+    payload = json.dumps(
+        {"media": media_hash, "model": model_size, "task": task, "options": options},
+        sort_keys=True,
+        default=str,
+    )
+    return hash_bytes(payload.encode("utf-8"))
+
+
+class TranscriptionCache:
+    """
+    On-disk store of Whisper results, one JSON file per key holding only the
+    `fields` worth keeping (by default `segments`, `text`, `language`). The
+    least recently read entries are evicted once the directory grows beyond
+    `max_bytes`.
+    """
+
+    def __init__(self, directory=CACHE_DIR, max_bytes: int = MAX_CACHE_MB * 1024 * 1024,
+                 fields=("segments", "text", "language")):
+        self.directory = pathlib.Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.fields = fields
+        self._lock = threading.Lock()
+
+    def _path(self, key: str) -> pathlib.Path:
+        return self.directory / f"{key}.json"
+
+    def get(self, key: str):
+        path = self._path(key)
+        try:
+            with open(path, "r", encoding="utf8") as f:
+                result = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            # Evicted by another process since it was read; the result is still good.
+            pass
+        return result
+
+    def put(self, key: str, result: dict):
+        entry = {field: result[field] for field in self.fields}
+        path = self._path(key)
+        tmp = path.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+        with open(tmp, "w", encoding="utf8") as f:
+            json.dump(entry, f, default=float)
+        os.replace(tmp, path)
+        self.evict()
+
+    def evict(self):
+        with self._lock:
+            entries = []
+            for path in self.directory.glob("*.json"):
+                try:
+                    stat = path.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+            total = sum(size for _, size, _ in entries)
+            for _, size, path in sorted(entries):
+                if total <= self.max_bytes:
+                    break
+                path.unlink(missing_ok=True)
+                total -= size
@@ -0,0 +1,94 @@
+import os
+import pathlib
+import sqlite3
+import threading
+import time
+import unicodedata
+from contextlib import contextmanager
+
+MEMORY_DB = pathlib.Path(os.environ.get("SUBTITLES_CACHE_DIR", pathlib.Path.home() / ".cache" / "subtitles")) / "translations.sqlite3"
+
+# Segments kept before the least recently used are evicted.
+MEMORY_ENTRIES = int(os.environ.get("SUBTITLES_TM_ENTRIES", "200000"))
+
+
+def normalize(text: str) -> str:
+    return " ".join(unicodedata.normalize("NFC", text).split())
+
+
+class TranslationMemory:
+    """
+    Persistent store of segment translations keyed by (normalized source text,
+    source language, target FLORES-200 code). A source language of None stands
+    for "detected by Sema". Lookups refresh an entry's recency; once more than
+    `max_entries` are stored the least recently used are dropped.
+    """
+
+    def __init__(self, path=MEMORY_DB, max_entries: int = MEMORY_ENTRIES):
+        self.path = str(path)
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        pathlib.Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+        with self._connect() as db:
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS memory (source_text TEXT, source_lang TEXT, target_lang TEXT,"
+                " translation TEXT, last_used REAL, PRIMARY KEY (source_text, source_lang, target_lang))"
+            )
+            db.execute("CREATE INDEX IF NOT EXISTS memory_last_used ON memory (last_used)")
+
+    @contextmanager
+    def _connect(self):
+        db = sqlite3.connect(self.path, timeout=30)
+        try:
+            with db:
+                yield db
+        finally:
+            db.close()
+
+    def lookup_many(self, texts, source_lang: str, target_lang: str) -> dict:
+        """Return {normalized text: translation} for the texts already in memory."""
+        keys = list(dict.fromkeys(normalize(text) for text in texts if text))
+        found = {}
+        with self._connect() as db:
+            for start in range(0, len(keys), 500):
+                chunk = keys[start:start + 500]
+                rows = db.execute(
+                    f"SELECT source_text, translation FROM memory WHERE source_lang = ? AND target_lang = ?"
+                    f" AND source_text IN ({', '.join('?' * len(chunk))})",
+                    (source_lang or "", target_lang, *chunk),
+                ).fetchall()
+                found.update(rows)
+            if found:
+                now = time.time()
+                db.executemany(
+                    "UPDATE memory SET last_used = ? WHERE source_text = ? AND source_lang = ? AND target_lang = ?",
+                    [(now, text, source_lang or "", target_lang) for text in found],
+                )
+        with self._lock:
+            self.hits += len(found)
+            self.misses += len(keys) - len(found)
+        return found
+
+    def lookup(self, text: str, source_lang: str, target_lang: str):
+        return self.lookup_many([text], source_lang, target_lang).get(normalize(text))
+
+    def store_many(self, pairs, source_lang: str, target_lang: str):
+        now = time.time()
+        rows = [(normalize(text), source_lang or "", target_lang, translation, now) for text, translation in pairs]
+        with self._connect() as db:
+            db.executemany("INSERT OR REPLACE INTO memory VALUES (?, ?, ?, ?, ?)", rows)
+            db.execute(
+                "DELETE FROM memory WHERE rowid IN (SELECT rowid FROM memory ORDER BY last_used DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,),
+            )
+
+    def store(self, text: str, source_lang: str, target_lang: str, translation: str):
+        self.store_many([(text, translation)], source_lang, target_lang)
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {"hits": self.hits, "misses": self.misses, "hit_rate": self.hits / lookups if lookups else 0.0}
@@ -1,7 +1,12 @@
+import io
+import json
+import re
 import textwrap
 import zlib
 from typing import Iterator, TextIO
 
+import numpy as np
+
 
 def exact_div(x, y):
     assert x % y == 0
@@ -45,22 +50,78 @@ def format_timestamp(seconds: float, always_include_hours: bool = False, fractio
     return f"{hours_marker}{minutes:02d}:{seconds:02d}{fractionalSeperator}{milliseconds:03d}"
 
 
+def format_timestamps(seconds, always_include_hours: bool = False, fractionalSeperator: str = '.') -> list:
+    """
+    Vectorized format_timestamp: the hour/minute/second split of a whole array
+    of times is done in NumPy at once, leaving only string assembly per item.
+    """
+    milliseconds = np.round(np.asarray(seconds, dtype=np.float64) * 1000.0).astype(np.int64)
+    assert (milliseconds >= 0).all(), "non-negative timestamp expected"
+
+    hours, milliseconds = np.divmod(milliseconds, 3_600_000)
+    minutes, milliseconds = np.divmod(milliseconds, 60_000)
+    seconds, milliseconds = np.divmod(milliseconds, 1_000)
+
+    return [
+        f"{h:02d}:{m:02d}:{s:02d}{fractionalSeperator}{ms:03d}" if always_include_hours or h > 0
+        else f"{m:02d}:{s:02d}{fractionalSeperator}{ms:03d}"
+        for h, m, s, ms in zip(hours.tolist(), minutes.tolist(), seconds.tolist(), milliseconds.tolist())
+    ]
+
+
+def _write(file, text: str):
+    if isinstance(file, (io.RawIOBase, io.BufferedIOBase)):
+        file.write(text.encode("utf-8"))
+    else:
+        file.write(text)
+
+
+def _is_batch(transcript) -> bool:
+    # Lists are formatted in one go; generators (e.g. a live TranscriptionStream)
+    # are written cue by cue so partial output is visible while they run.
+    return isinstance(transcript, (list, tuple))
+
+
+def format_txt(segments: list) -> str:
+    return "".join(f"{segment['text'].strip()}\n" for segment in segments)
+
+
+def format_vtt(segments: list, maxLineWidth=None, header: bool = True) -> str:
+    starts = format_timestamps([segment['start'] for segment in segments])
+    ends = format_timestamps([segment['end'] for segment in segments])
+    cues = [
+        f"{start} --> {end}\n{processText(segment['text'].strip(), maxLineWidth).replace('-->', '->')}\n\n"
+        for start, end, segment in zip(starts, ends, segments)
+    ]
+    return ("WEBVTT\n\n" if header else "") + "".join(cues)
+
+
+def format_srt(segments: list, maxLineWidth=None, start_index: int = 1) -> str:
+    starts = format_timestamps([segment['start'] for segment in segments], always_include_hours=True, fractionalSeperator=',')
+    ends = format_timestamps([segment['end'] for segment in segments], always_include_hours=True, fractionalSeperator=',')
+    cues = [
+        f"{i}\n{start} --> {end}\n{processText(segment['text'].strip(), maxLineWidth).replace('-->', '->')}\n\n"
+        for i, start, end, segment in zip(range(start_index, start_index + len(segments)), starts, ends, segments)
+    ]
+    return "".join(cues)
+
+
 def write_txt(transcript: Iterator[dict], file: TextIO):
+    if _is_batch(transcript):
+        _write(file, format_txt(transcript))
+        return
     for segment in transcript:
-        print(segment['text'].strip(), file=file, flush=True)
+        _write(file, f"{segment['text'].strip()}\n")
 
 
 def write_vtt(transcript: Iterator[dict], file: TextIO, maxLineWidth=None):
-    print("WEBVTT\n", file=file)
+    if _is_batch(transcript):
+        _write(file, format_vtt(transcript, maxLineWidth))
+        return
+    _write(file, "WEBVTT\n\n")
     for segment in transcript:
-        text = processText(segment['text'], maxLineWidth).replace('-->', '->')
-
-        print(
-            f"{format_timestamp(segment['start'])} --> {format_timestamp(segment['end'])}\n"
-            f"{text}\n",
-            file=file,
-            flush=True,
-        )
+        text = processText(segment['text'].strip(), maxLineWidth).replace('-->', '->')
+        _write(file, f"{format_timestamp(segment['start'])} --> {format_timestamp(segment['end'])}\n{text}\n\n")
 
 
 def write_srt(transcript: Iterator[dict], file: TextIO, maxLineWidth=None):
@@ -74,23 +135,166 @@ def write_srt(transcript: Iterator[dict], file: TextIO, maxLineWidth=None):
         audio_basename = Path(audio_path).stem
         with open(Path(output_dir) / (audio_basename + ".srt"), "w", encoding="utf-8") as srt:
             write_srt(result["segments"], file=srt)
+
+    `file` may also be a binary buffer such as io.BytesIO, which receives UTF-8.
     """
+    if _is_batch(transcript):
+        _write(file, format_srt(transcript, maxLineWidth))
+        return
     for i, segment in enumerate(transcript, start=1):
         text = processText(segment['text'].strip(), maxLineWidth).replace('-->', '->')
-
-        # write srt lines
-        print(
+        _write(
+            file,
             f"{i}\n"
             f"{format_timestamp(segment['start'], always_include_hours=True, fractionalSeperator=',')} --> "
             f"{format_timestamp(segment['end'], always_include_hours=True, fractionalSeperator=',')}\n"
-            f"{text}\n",
-            file=file,
-            flush=True,
+            f"{text}\n\n",
         )
 
+
+SUBTITLE_FORMATS = ("txt", "vtt", "srt", "json", "ass")
+
+_ASS_HEADER = (
+    "[Script Info]\nScriptType: v4.00+\nWrapStyle: 2\nScaledBorderAndShadow: yes\n\n"
+    "[V4+ Styles]\n"
+    "Format: Name, Fontname, Fontsize, PrimaryColour, SecondaryColour, OutlineColour, BackColour, Bold, Italic,"
+    " Underline, StrikeOut, ScaleX, ScaleY, Spacing, Angle, BorderStyle, Outline, Shadow, Alignment,"
+    " MarginL, MarginR, MarginV, Encoding\n"
+    "Style: Default,Arial,20,&H00FFFFFF,&H000000FF,&H00000000,&H80000000,0,0,0,0,100,100,0,0,1,2,1,2,10,10,20,1\n\n"
+    "[Events]\nFormat: Layer, Start, End, Style, Name, MarginL, MarginR, MarginV, Effect, Text\n"
+)
+
+
+def _ass_timestamps(seconds) -> list:
+    centiseconds = np.round(np.asarray(seconds, dtype=np.float64) * 100.0).astype(np.int64)
+    hours, centiseconds = np.divmod(centiseconds, 360_000)
+    minutes, centiseconds = np.divmod(centiseconds, 6_000)
+    seconds, centiseconds = np.divmod(centiseconds, 100)
+    return [
+        f"{h}:{m:02d}:{s:02d}.{cs:02d}"
+        for h, m, s, cs in zip(hours.tolist(), minutes.tolist(), seconds.tolist(), centiseconds.tolist())
+    ]
+
+
+def export_subtitles(segments, formats=("txt", "vtt", "srt"), maxLineWidth=None) -> dict:
+    """
+    Render a transcript in several formats at once, returning {format: UTF-8 bytes}
+    ready to hand to a download button or write to disk.
+
+    Each segment's text is stripped and wrapped to `maxLineWidth` once,
+    however many formats are asked for; TXT, VTT and SRT are then laid out by
+    format_txt(), format_vtt() and format_srt(), so they match write_txt() and
+    friends. `formats` may include any of SUBTITLE_FORMATS.
+    """
+    unknown = set(formats) - set(SUBTITLE_FORMATS)
+    if unknown:
+        raise ValueError(f"Unknown format {', '.join(sorted(unknown))}")
+
+    segments = list(segments)
+    plain = [segment['text'].strip() for segment in segments]
+    wrapped = [processText(text, maxLineWidth).replace('-->', '->') for text in plain]
+    starts = [segment['start'] for segment in segments]
+    ends = [segment['end'] for segment in segments]
+
+    cues = [{'start': start, 'end': end, 'text': text} for start, end, text in zip(starts, ends, wrapped)]
+
+    exports = {}
+    if "txt" in formats:
+        exports["txt"] = format_txt(segments)
+    if "vtt" in formats:
+        exports["vtt"] = format_vtt(cues)
+    if "srt" in formats:
+        exports["srt"] = format_srt(cues)
+    if "json" in formats:
+        exports["json"] = json.dumps(
+            {"segments": [
+                {"id": i, "start": start, "end": end, "text": text}
+                for i, (start, end, text) in enumerate(zip(starts, ends, plain))
+            ]},
+            ensure_ascii=False,
+            default=float,
+        )
+    if "ass" in formats:
+        # ASS marks a hard line break with \N.
+        cues = zip(_ass_timestamps(starts), _ass_timestamps(ends), (text.replace("\n", "\\N") for text in wrapped))
+        exports["ass"] = _ASS_HEADER + "".join(
+            f"Dialogue: 0,{start},{end},Default,,0,0,0,,{text}\n" for start, end, text in cues
+        )
+
+    return {format: text.encode("utf-8") for format, text in exports.items()}
+
+
 def processText(text: str, maxLineWidth=None):
     if (maxLineWidth is None or maxLineWidth < 0):
         return text
 
     lines = textwrap.wrap(text, width=maxLineWidth, tabsize=4)
     return '\n'.join(lines)
+
+
+_TIMESTAMP = re.compile(r'(?:(\d+):)?(\d{1,2}):(\d{1,2})[.,](\d{1,3})')
+
+
+def parse_timestamp(timestamp: str) -> float:
+    match = _TIMESTAMP.match(timestamp.strip())
+    if match is None:
+        raise ValueError(f"Invalid timestamp {timestamp!r}")
+    hours, minutes, seconds, fraction = match.groups()
+    return int(hours or 0) * 3600 + int(minutes) * 60 + int(seconds) + int(fraction.ljust(3, '0')) / 1000
+
+
+def _parse_timing(line: str):
+    start, _, rest = line.partition('-->')
+    try:
+        return parse_timestamp(start), parse_timestamp(rest.split(maxsplit=1)[0])
+    except (ValueError, IndexError):
+        return None
+
+
+def parse_subtitles(file) -> Iterator[dict]:
+    """
+    Parse an SRT or WebVTT file into the segment dicts (`start`, `end`, `text`)
+    that write_srt and write_vtt consume.
+
+    The file (text or binary, e.g. a Streamlit upload) is read line by line and
+    cues are yielded as soon as they end, so memory stays bounded by the
+    longest cue. Cues with an unreadable timing line are skipped, WebVTT
+    headers, NOTE/STYLE/REGION blocks and cue settings are ignored, and a
+    missing blank line between cues is tolerated.
+    """
+    cue = None
+    text = []
+    skipping = False
+
+    def finish(next_index=False):
+        # Without a blank line, the SRT index of the next cue ends up in this one.
+        if next_index and text and text[-1].isdigit():
+            text.pop()
+        return {'start': cue[0], 'end': cue[1], 'text': '\n'.join(text)}
+
+    for i, line in enumerate(file):
+        if isinstance(line, bytes):
+            line = line.decode('utf-8', errors='replace')
+        line = line.rstrip('\r\n')
+        if i == 0:
+            line = line.lstrip('\ufeff')
+            if line.startswith('WEBVTT'):
+                skipping = True
+                continue
+
+        if '-->' in line and not skipping:
+            timing = _parse_timing(line)
+            if cue is not None:
+                yield finish(next_index=True)
+            cue, text, skipping = timing, [], timing is None
+        elif not line.strip():
+            if cue is not None:
+                yield finish()
+            cue, text, skipping = None, [], False
+        elif cue is not None:
+            text.append(line)
+        elif not skipping and line.startswith(('NOTE', 'STYLE', 'REGION')):
+            skipping = True
+
+    if cue is not None:
+        yield finish()
@@ -0,0 +1,109 @@
+import os
+import pathlib
+import shutil
+import tempfile
+import time
+import uuid
+
+WORKSPACE_ROOT = pathlib.Path(os.environ.get("SUBTITLES_WORKSPACE_DIR", pathlib.Path(tempfile.gettempdir()) / "subtitles-jobs"))
+
+# Workspaces untouched for longer than this many seconds are deleted.
+WORKSPACE_TTL = int(os.environ.get("SUBTITLES_WORKSPACE_TTL", str(6 * 3600)))
+
+# Total size of all workspaces, in megabytes, before the least recently used are deleted.
+WORKSPACE_QUOTA_MB = int(os.environ.get("SUBTITLES_WORKSPACE_MB", "10240"))
+
+
+# Functions registered with keeper(), each returning workspace paths still in use elsewhere.
+_keepers = []
+
+
+def keeper(fn):
+    """Register `fn() -> paths` of workspaces that reclaim() must not delete, such as those of unfinished jobs."""
+    _keepers.append(fn)
+    return fn
+
+
+def _usage(path: pathlib.Path) -> int:
+    return sum(f.stat().st_size for f in path.rglob("*") if f.is_file())
+
+
+def reclaim(root=WORKSPACE_ROOT, ttl: int = WORKSPACE_TTL, quota_bytes: int = WORKSPACE_QUOTA_MB * 1024 * 1024, keep=()):
+    """
+    Delete workspaces under `root` that have not been touched for `ttl`
+    seconds, then the least recently touched ones until the rest fit in
+    `quota_bytes`. Paths in `keep`, or returned by a keeper(), are never
+    deleted.
+    """
+    root = pathlib.Path(root)
+    if not root.exists():
+        return
+    keep = {pathlib.Path(path) for path in keep} | {pathlib.Path(path) for fn in _keepers for path in fn()}
+    now = time.time()
+    entries = []
+    for path in root.iterdir():
+        if not path.is_dir() or path in keep:
+            continue
+        try:
+            touched = path.stat().st_mtime
+            if now - touched > ttl:
+                shutil.rmtree(path, ignore_errors=True)
+            else:
+                entries.append((touched, _usage(path), path))
+        except FileNotFoundError:
+            continue
+
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total <= quota_bytes:
+            break
+        shutil.rmtree(path, ignore_errors=True)
+        total -= size
+
+
+def touch_workspace(workspace_id: str, root=WORKSPACE_ROOT) -> bool:
+    """Mark the existing workspace `workspace_id` as just used, without reclaiming; False if it is gone."""
+    try:
+        os.utime(pathlib.Path(root) / workspace_id)
+    except FileNotFoundError:
+        return False
+    return True
+
+
+class Workspace:
+    """
+    A private directory for one job's media and subtitle files, so concurrent
+    users never share a filename.
+
+        workspace = Workspace()
+        with open(workspace.file("transcript.srt"), "w") as f:
+            ...
+    """
+
+    def __init__(self, job_id: str = None, root=WORKSPACE_ROOT):
+        self.id = job_id or uuid.uuid4().hex
+        self.path = pathlib.Path(root) / self.id
+        self.path.mkdir(parents=True, exist_ok=True)
+        reclaim(root, keep=[self.path])
+
+    def file(self, name: str) -> str:
+        return str(self.path / name)
+
+    def touch(self):
+        os.utime(self.path)
+
+    def exists(self) -> bool:
+        return self.path.exists()
+
+    def cleanup(self):
+        shutil.rmtree(self.path, ignore_errors=True)
+
+
+def session_workspace(state) -> Workspace:
+    """Return the workspace stored in `state` (e.g. st.session_state), creating it if needed."""
+    workspace = state.get("workspace")
+    if workspace is None or not workspace.exists():
+        workspace = Workspace()
+        state["workspace"] = workspace
+    workspace.touch()
+    return workspace
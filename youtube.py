@@ -0,0 +1,167 @@
+import os
+import pathlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import ffmpeg
+import numpy as np
+from urllib.error import HTTPError
+
+from pytube import request
+from whisper.audio import SAMPLE_RATE
+
+from audio import decode_audio, stream_decode
+from workspace import reclaim
+from youtube_metadata import best_video, resolve, video_id
+
+# Downloaded videos, one directory per video ID, shared by every session and job.
+MEDIA_DIR = pathlib.Path(os.environ.get("SUBTITLES_CACHE_DIR", pathlib.Path.home() / ".cache" / "subtitles")) / "media"
+
+# Videos unused for longer than this many seconds are deleted.
+MEDIA_TTL = int(os.environ.get("SUBTITLES_MEDIA_TTL", str(24 * 3600)))
+
+# Total size of the downloaded videos, in megabytes, before the least recently used are deleted.
+MEDIA_QUOTA_MB = int(os.environ.get("SUBTITLES_MEDIA_MB", "10240"))
+
+# Downloads running at once, across all sessions.
+DOWNLOAD_WORKERS = int(os.environ.get("SUBTITLES_DOWNLOAD_WORKERS", "4"))
+
+_downloads = ThreadPoolExecutor(max_workers=DOWNLOAD_WORKERS)
+_fetches = {}
+_fetches_lock = threading.Lock()
+
+
+def media_key(link: str) -> str:
+    """Stands in for hash_audio() when audio is decoded before it has all arrived."""
+    return f"youtube:{video_id(link)}"
+
+
+class Fetch:
+    """
+    One download of a video into the media cache. Readers can follow the file
+    while it is being written with chunks(), so decoding starts on the first
+    bytes, and result() waits for the finished file.
+    """
+
+    def __init__(self, link: str, path: pathlib.Path):
+        self.path = path
+        # Named per process so two workers fetching the same video never write one file.
+        self.part = path.with_suffix(f".{os.getpid()}.part")
+        self.size = 0
+        self.finished = False
+        self._changed = threading.Condition()
+        if path.exists():
+            self.size, self.finished = path.stat().st_size, True
+            self.future = None
+        else:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            self.part.write_bytes(b"")
+            self.future = _downloads.submit(self._download, link)
+
+    def _download(self, link: str) -> str:
+        try:
+            with open(self.part, "wb") as f:
+                try:
+                    self._write(f, best_video(resolve(link))["url"])
+                except HTTPError:
+                    # A cached stream URL YouTube no longer honours; look the video up again.
+                    if self.size:
+                        raise
+                    self._write(f, best_video(resolve(link, refresh=True))["url"])
+            os.replace(self.part, self.path)
+        finally:
+            with self._changed:
+                self.finished = True
+                self._changed.notify_all()
+        return str(self.path)
+
+    def _write(self, f, url: str):
+        for chunk in request.stream(url):
+            f.write(chunk)
+            f.flush()
+            with self._changed:
+                self.size += len(chunk)
+                self._changed.notify_all()
+
+    def result(self) -> str:
+        return self.future.result() if self.future is not None else str(self.path)
+
+    def failed(self) -> bool:
+        return self.future is not None and self.future.done() and self.future.exception() is not None
+
+    def _open(self):
+        try:
+            return open(self.part, "rb")
+        except FileNotFoundError:
+            # Renamed to its final name in the meantime.
+            return open(self.path, "rb")
+
+    def chunks(self):
+        """Yield the bytes of the video as they are written, up to the end of the download."""
+        offset = 0
+        with (open(self.path, "rb") if self.future is None else self._open()) as f:
+            while True:
+                with self._changed:
+                    while self.size <= offset and not self.finished:
+                        self._changed.wait()
+                    size, finished = self.size, self.finished
+                if offset < size:
+                    data = f.read(size - offset)
+                    offset += len(data)
+                    yield data
+                elif finished:
+                    break
+
+
+def fetch(link: str) -> Fetch:
+    """
+    Start fetching the video of `link` into the media cache, unless it is
+    there already or being downloaded. Returns the Fetch shared by every
+    caller asking for the same video ID.
+    """
+    key = video_id(link)
+    with _fetches_lock:
+        active = [MEDIA_DIR / other for other, entry in _fetches.items() if not entry.finished]
+        reclaim(MEDIA_DIR, MEDIA_TTL, MEDIA_QUOTA_MB * 1024 * 1024, keep=active)
+        entry = _fetches.get(key)
+        if entry is None or entry.failed() or (entry.finished and not entry.path.exists()):
+            entry = _fetches[key] = Fetch(link, MEDIA_DIR / key / "video.mp4")
+        os.utime(entry.path.parent)
+        return entry
+
+
+def download_video(link: str) -> str:
+    """Path of the cached video of `link`, waiting for its download to finish."""
+    return fetch(link).result()
+
+
+def stream_audio(link: str, block_seconds: float = 30):
+    """
+    Yield the 16 kHz audio of `link` in float32 blocks of `block_seconds`,
+    decoded from the same download as the video while it is still arriving,
+    so transcription overlaps the fetch and nothing is fetched twice.
+
+    A video whose index sits at the end of the file cannot be decoded from a
+    pipe; its audio is decoded once the download has finished instead.
+    """
+    media = fetch(link)
+    started = False
+    try:
+        for block in stream_decode(media.chunks(), block_seconds=block_seconds):
+            started = True
+            yield block
+        # A download that broke off shows up here rather than as truncated audio.
+        media.result()
+    except ffmpeg.Error:
+        if started:
+            raise
+        audio = decode_audio(media.result())
+        window = int(block_seconds * SAMPLE_RATE)
+        for start in range(0, len(audio), window):
+            yield audio[start:start + window]
+
+
+def load_audio(link: str) -> np.ndarray:
+    """The whole audio of `link`, decoded as it downloads rather than after."""
+    blocks = list(stream_audio(link))
+    return np.concatenate(blocks) if blocks else np.zeros(0, np.float32)
@@ -0,0 +1,184 @@
+"""
+Resolve YouTube links to their metadata and stream manifest once, and share
+the answer between sessions, jobs and processes.
+
+    record = resolve("https://youtu.be/dQw4w9WgXcQ")
+    record["title"], record["length"], best_video(record)["url"]
+
+Records are JSON files under SUBTITLES_CACHE_DIR/metadata, one per video ID,
+so tests and offline runs can answer from recorded files instead of YouTube:
+
+    python youtube_metadata.py https://youtu.be/dQw4w9WgXcQ -o fixtures/
+    resolver = MetadataResolver(MetadataStore(tmp_dir), loader=fixture_loader("fixtures/"))
+"""
+import argparse
+import json
+import os
+import pathlib
+import re
+import threading
+import time
+from urllib.parse import parse_qs, urlparse
+
+from pytube import YouTube, extract
+from pytube.exceptions import RegexMatchError
+
+METADATA_DIR = pathlib.Path(os.environ.get("SUBTITLES_CACHE_DIR", pathlib.Path.home() / ".cache" / "subtitles")) / "metadata"
+
+# Seconds a record is reused before YouTube is asked again; sooner if its stream URLs expire first.
+METADATA_TTL = int(os.environ.get("SUBTITLES_METADATA_TTL", "3600"))
+
+# Stream URLs are treated as expired this many seconds before YouTube's own deadline.
+EXPIRY_MARGIN = 600
+
+_VIDEO_ID = re.compile(r"^[0-9A-Za-z_-]{11}$")
+
+
+def video_id(link: str) -> str:
+    """
+    The 11-character ID of a YouTube video, from any of its link forms
+    (watch, youtu.be, embed, shorts) or the bare ID. Raises ValueError for
+    anything else.
+    """
+    link = link.strip()
+    if _VIDEO_ID.match(link):
+        return link
+    try:
+        return extract.video_id(link)
+    except RegexMatchError:
+        raise ValueError(f"Not a YouTube link: {link}") from None
+
+
+def watch_url(video_id: str) -> str:
+    return f"https://www.youtube.com/watch?v={video_id}"
+
+
+def _url_expiry(url: str) -> float:
+    expire = parse_qs(urlparse(url).query).get("expire")
+    return float(expire[0]) if expire else float("inf")
+
+
+def load_metadata(video_id: str) -> dict:
+    """Ask YouTube for the metadata and stream manifest of `video_id`, building one pytube object for both."""
+    yt = YouTube(watch_url(video_id))
+    streams = [
+        {"itag": stream.itag, "mime_type": stream.mime_type, "progressive": stream.is_progressive,
+         "resolution": stream.resolution, "abr": stream.abr, "url": stream.url}
+        for stream in yt.streams
+    ]
+    return {
+        "video_id": video_id, "title": yt.title, "author": yt.author, "description": yt.description,
+        "thumbnail_url": yt.thumbnail_url, "length": yt.length, "views": yt.views, "streams": streams,
+    }
+
+
+def fixture_loader(directory):
+    """A loader answering from `<video_id>.json` files recorded in `directory` instead of YouTube."""
+    def load(video_id: str) -> dict:
+        return json.loads((pathlib.Path(directory) / f"{video_id}.json").read_text(encoding="utf8"))
+    return load
+
+
+class MetadataStore:
+    """On-disk records, one JSON file per video ID, each with the time it `expires`."""
+
+    def __init__(self, directory=METADATA_DIR):
+        self.directory = pathlib.Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+    def _path(self, video_id: str) -> pathlib.Path:
+        return self.directory / f"{video_id}.json"
+
+    def get(self, video_id: str):
+        try:
+            with open(self._path(video_id), "r", encoding="utf8") as f:
+                record = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+        if record.get("expires", 0) <= time.time():
+            self._path(video_id).unlink(missing_ok=True)
+            return None
+        return record
+
+    def put(self, video_id: str, record: dict, ttl: float = METADATA_TTL):
+        expires = min([time.time() + ttl] + [_url_expiry(stream["url"]) - EXPIRY_MARGIN
+                                             for stream in record.get("streams", [])])
+        record = dict(record, expires=expires)
+        path = self._path(video_id)
+        tmp = path.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+        with open(tmp, "w", encoding="utf8") as f:
+            json.dump(record, f)
+        os.replace(tmp, path)
+        return record
+
+
+class MetadataResolver:
+    """
+    Turns links into records, asking `loader` (YouTube by default) only when
+    `store` has no fresh record. Concurrent requests for one video wait for a
+    single lookup.
+    """
+
+    def __init__(self, store: MetadataStore = None, loader=load_metadata, ttl: float = METADATA_TTL):
+        self.store = store if store is not None else MetadataStore()
+        self.loader = loader
+        self.ttl = ttl
+        self._locks = {}
+        self._lock = threading.Lock()
+
+    def resolve(self, link: str, refresh: bool = False) -> dict:
+        """The record of the video `link` points to; `refresh` skips the store, e.g. after a stream URL was refused."""
+        key = video_id(link)
+        with self._lock:
+            lock = self._locks.setdefault(key, threading.Lock())
+        with lock:
+            record = None if refresh else self.store.get(key)
+            if record is None:
+                record = self.store.put(key, self.loader(key), self.ttl)
+            return record
+
+
+_resolver = None
+_resolver_lock = threading.Lock()
+
+
+def get_resolver() -> MetadataResolver:
+    global _resolver
+    with _resolver_lock:
+        if _resolver is None:
+            _resolver = MetadataResolver()
+        return _resolver
+
+
+def resolve(link: str, refresh: bool = False) -> dict:
+    return get_resolver().resolve(link, refresh)
+
+
+def best_video(record: dict) -> dict:
+    """
+    The one stream fetched per video: the best progressive MP4. It carries
+    the audio as well, so Whisper hears exactly the track that is rendered.
+    """
+    candidates = [stream for stream in record["streams"]
+                  if stream["progressive"] and stream["mime_type"] == "video/mp4"]
+    if not candidates:
+        raise ValueError(f"No progressive MP4 stream for {record['video_id']}")
+    return max(candidates, key=lambda stream: int((stream["resolution"] or "0p").rstrip("p")))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Record the metadata of YouTube videos as fixture files.")
+    parser.add_argument("links", nargs="+")
+    parser.add_argument("-o", "--output", default="fixtures")
+    args = parser.parse_args()
+
+    output = pathlib.Path(args.output)
+    output.mkdir(parents=True, exist_ok=True)
+    for link in args.links:
+        key = video_id(link)
+        (output / f"{key}.json").write_text(json.dumps(load_metadata(key), indent=2), encoding="utf8")
+        print(output / f"{key}.json")
+
+
+if __name__ == "__main__":
+    main()